@@ -1,3 +1,4 @@
 from .DSL import DSL, DSL_ALL
 from .dsl_types import *
-from .dsl_toggle_categories import *
\ No newline at end of file
+from .dsl_toggle_categories import *
+from .type_chart import TYPE_EFFECTIVENESS, TYPE_INDEX, type_multiplier, type_multipliers
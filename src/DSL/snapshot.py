@@ -0,0 +1,173 @@
+"""Per-turn feature snapshots read by the DSL methods.
+
+A script calls the same DSL methods for every available move, and every `DSL` built for the same
+decision point (e.g. several scripts judged on one cached battle state) asks the same questions.
+`TurnSnapshot.of(battle)` returns one snapshot per decision point, in which each battle-level
+feature is read from poke_env, range-checked against its `okay_values` and cast once, on first use.
+Static move data is read once per move id into a `MoveFeatures`, shared by every snapshot.
+"""
+import weakref
+
+from poke_env.environment.move import Move
+
+from .dsl_types import *
+from .type_chart import type_multiplier
+
+_UNSET = object()
+
+
+class MoveFeatures(object):
+    """The fields of a poke_env `Move` the DSL reads, all of which only depend on the move's id"""
+    __slots__ = ('id', 'type', 'category', 'status', 'base_power', 'accuracy', 'boosts', 'weather',
+                 'self_destruct')
+
+    def __init__(self, move: Move):
+        self.id = move.id
+        self.type = move.type
+        self.category = move.category
+        self.status = move.status
+        self.base_power = move.base_power
+        self.accuracy = round(move.accuracy * 100)
+        self.boosts = move.boosts
+        self.weather = move.weather
+        self.self_destruct = move.self_destruct
+
+
+_move_features = {}
+
+
+def move_features(move: Move) -> MoveFeatures:
+    try:
+        return _move_features[move.id]
+    except KeyError:
+        features = _move_features[move.id] = MoveFeatures(move)
+        return features
+
+
+class TurnSnapshot(object):
+    __slots__ = ('battle_weather', 'turn', 'active', 'opponent', '_player_base_stats', '_opponent_base_stats',
+                 '_player_boosts', '_opponent_boosts', '_player_status', '_opponent_status',
+                 '_player_health', '_opponent_health', '_weather', '_player_types', '_type_multipliers',
+                 '__weakref__')
+
+    _snapshots = weakref.WeakKeyDictionary()
+
+    def __init__(self, battle):
+        # Nothing here may reference the battle, which would keep it alive as a key of `_snapshots`
+        self.battle_weather = battle.weather
+        self.turn = battle.turn
+        self.active = battle.active_pokemon
+        self.opponent = battle.opponent_active_pokemon
+        self._player_base_stats = {}
+        self._opponent_base_stats = {}
+        self._player_boosts = {}
+        self._opponent_boosts = {}
+        self._player_status = _UNSET
+        self._opponent_status = _UNSET
+        self._player_health = _UNSET
+        self._opponent_health = _UNSET
+        self._weather = _UNSET
+        self._player_types = None
+        self._type_multipliers = {}
+
+    @classmethod
+    def of(cls, battle):
+        """The battle's snapshot for its current decision point, reused until the turn or either
+        active Pokemon changes"""
+        snapshot = cls._snapshots.get(battle)
+        if (snapshot is None or snapshot.turn != battle.turn or snapshot.active is not battle.active_pokemon
+                or snapshot.opponent is not battle.opponent_active_pokemon):
+            snapshot = cls._snapshots[battle] = cls(battle)
+        return snapshot
+
+    def player_base_stat(self, category) -> StatValue:
+        try:
+            return self._player_base_stats[category]
+        except KeyError:
+            precast = self.active.base_stats[category]
+            assert precast in StatValue.okay_values
+            value = self._player_base_stats[category] = StatValue(precast)
+            return value
+
+    def opponent_base_stat(self, category) -> StatValue:
+        try:
+            return self._opponent_base_stats[category]
+        except KeyError:
+            precast = self.opponent.base_stats[category]
+            assert precast in StatValue.okay_values
+            value = self._opponent_base_stats[category] = StatValue(precast)
+            return value
+
+    def player_boost(self, category) -> BattleStatModifier:
+        try:
+            return self._player_boosts[category]
+        except KeyError:
+            precast = self.active._boosts[category]
+            assert precast in BattleStatModifier.okay_values
+            value = self._player_boosts[category] = BattleStatModifier(precast)
+            return value
+
+    def opponent_boost(self, category) -> BattleStatModifier:
+        try:
+            return self._opponent_boosts[category]
+        except KeyError:
+            precast = self.opponent._boosts[category]
+            assert precast in BattleStatModifier.okay_values
+            value = self._opponent_boosts[category] = BattleStatModifier(precast)
+            return value
+
+    @property
+    def player_status(self) -> OptionalStatus:
+        if self._player_status is _UNSET:
+            precast = self.active.status
+            assert precast in OptionalStatus.okay_values
+            self._player_status = OptionalStatus(precast)
+        return self._player_status
+
+    @property
+    def opponent_status(self) -> OptionalStatus:
+        if self._opponent_status is _UNSET:
+            precast = self.opponent.status
+            assert precast in OptionalStatus.okay_values
+            self._opponent_status = OptionalStatus(precast)
+        return self._opponent_status
+
+    @property
+    def player_health(self) -> PercentageValue:
+        if self._player_health is _UNSET:
+            precast = round(self.active.current_hp_fraction * 100)
+            assert precast in PercentageValue.okay_values
+            self._player_health = PercentageValue(precast)
+        return self._player_health
+
+    @property
+    def opponent_health(self) -> PercentageValue:
+        if self._opponent_health is _UNSET:
+            precast = round(self.opponent.current_hp_fraction * 100)
+            assert precast in PercentageValue.okay_values
+            self._opponent_health = PercentageValue(precast)
+        return self._opponent_health
+
+    @property
+    def weather(self) -> OptionalWeather:
+        if self._weather is _UNSET:
+            precast = self.battle_weather
+            assert precast in OptionalWeather.okay_values
+            self._weather = OptionalWeather(precast)
+        return self._weather
+
+    @property
+    def player_types(self):
+        if self._player_types is None:
+            self._player_types = self.active.types
+        return self._player_types
+
+    def type_multiplier(self, move_type) -> TypeMultiplier:
+        """Damage multiplier of a move type against the opponent's active Pokemon"""
+        try:
+            return self._type_multipliers[move_type]
+        except KeyError:
+            precast = type_multiplier(move_type, self.opponent.types)
+            assert precast in TypeMultiplier.okay_values
+            value = self._type_multipliers[move_type] = TypeMultiplier(precast)
+            return value
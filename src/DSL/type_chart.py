@@ -0,0 +1,49 @@
+"""Type-effectiveness lookups from a table precomputed at import time.
+
+`TYPE_EFFECTIVENESS[attacking, defending_1, defending_2]` is the damage multiplier of a move type
+against a Pokemon with the two defending types, indexed by `TYPE_INDEX`. A single-typed Pokemon
+uses its type twice: no Pokemon has the same type in both slots, so the diagonal holds the
+single-type multipliers.
+"""
+import numpy as np
+from poke_env.environment.pokemon_type import PokemonType
+
+TYPES = list(PokemonType)
+TYPE_INDEX = {pokemon_type: index for index, pokemon_type in enumerate(TYPES)}
+
+
+def _build_table():
+    table = np.empty((len(TYPES),) * 3)
+    for attacking, attacking_type in enumerate(TYPES):
+        for first, first_type in enumerate(TYPES):
+            for second, second_type in enumerate(TYPES):
+                if first == second:
+                    table[attacking, first, second] = attacking_type.damage_multiplier(first_type)
+                else:
+                    table[attacking, first, second] = attacking_type.damage_multiplier(first_type, second_type)
+    table.setflags(write=False)
+    return table
+
+
+TYPE_EFFECTIVENESS = _build_table()
+# Nested lists give plain floats, and are faster than NumPy for one lookup at a time
+_TABLE = TYPE_EFFECTIVENESS.tolist()
+
+
+def defending_indices(types):
+    """Table indices of a Pokemon's `types` pair, whose second type may be None"""
+    first, second = types
+    first = TYPE_INDEX[first]
+    return first, first if second is None else TYPE_INDEX[second]
+
+
+def type_multiplier(move_type, types) -> float:
+    """Same as `move_type.damage_multiplier(*types)`"""
+    first, second = defending_indices(types)
+    return _TABLE[TYPE_INDEX[move_type]][first][second]
+
+
+def type_multipliers(moves, types) -> np.ndarray:
+    """Damage multipliers of every move in `moves` against a Pokemon with `types`"""
+    first, second = defending_indices(types)
+    return TYPE_EFFECTIVENESS[[TYPE_INDEX[move.type] for move in moves], first, second]
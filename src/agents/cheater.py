@@ -18,7 +18,7 @@ class CheaterPlayer(Player):
 				return self.create_order(move)
 		
 		for move in battle.available_moves:
-			if dsl.gets_STAB(move) and dsl.is_not_ineffective(move):
+			if dsl.gets_stab(move) and dsl.is_not_ineffective(move):
 				return self.create_order(move)
 		
 		for move in battle.available_moves:
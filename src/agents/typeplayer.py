@@ -1,16 +1,18 @@
 from poke_env.player.player import Player
 from poke_env.environment.battle import Battle
+from DSL import type_multipliers
+import numpy as np
 
 class TypePlayer(Player):
 	def choose_move(self, battle: Battle):
 		# If the player can attack, it will
 
 		if battle.available_moves:
-			# Finds the most type-effective move among available ones
-			for move in battle.available_moves:
-				opptypes = battle.opponent_active_pokemon.types
-				if move.type.damage_multiplier(*battle.opponent_active_pokemon.types)>1:
-					return self.create_order(move)
+			# Finds the first type-advantageous move among available ones
+			multipliers = type_multipliers(battle.available_moves, battle.opponent_active_pokemon.types)
+			advantageous = np.flatnonzero(multipliers > 1)
+			if advantageous.size:
+				return self.create_order(battle.available_moves[advantageous[0]])
 
 		# If no type-advantageous attack is chosen, a random move will be chosen.
 		return self.choose_random_move(battle)
\ No newline at end of file
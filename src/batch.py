@@ -0,0 +1,363 @@
+"""Batch decision engine: scores every candidate move of many battles at once with NumPy.
+
+`compile_batch` turns a tree into a `BatchScript`. Every distinct DSL call in the tree (a function
+with its constant arguments) becomes one feature. `feature_tensor` evaluates the features of a list
+of battles into a (battles x moves x features) array. Move-independent features are evaluated once
+per battle and broadcast over its moves; features that only depend on the move are tabulated once per
+move id and gathered for the whole batch, and type effectiveness and STAB come straight from the
+type chart. The tree itself is compiled into NumPy operations over that array, so scoring and
+picking the best move for all pending decisions is one vectorized pass.
+
+Feature values are encoded as floats: numbers as themselves, `None` as -1 and enum members as
+distinct codes, so `==`/`!=` against enum literals behave as they do in Python. Unlike the
+generated scripts, which short-circuit `and`/`or` and skip nested blocks, every feature is
+evaluated for every move. A DSL call that fails for a battle therefore fails its whole decision,
+which `choose_moves` reports as `None`.
+"""
+import random
+import time
+
+import numpy as np
+
+from .core import RULE, DSL, Script, derive, get_random_tree, render_script, ScriptCache
+from .compiler import literal, COMPARATORS
+from .DSL.snapshot import move_features
+from .DSL.type_chart import TYPE_EFFECTIVENESS, TYPE_INDEX, defending_indices
+
+# DSL methods whose value only depends on the move and constant arguments, tabulated per move id
+_MOVE_STATIC = frozenset({
+    'check_move_boosts_stat', 'check_move_inflicts_status_condition', 'check_move_is_gyro_ball',
+    'check_move_rainy', 'check_move_sds_always', 'check_move_sds_if_hits_opp', 'check_move_sunny',
+    'move_accuracy', 'move_base_power', 'move_is_physical', 'move_is_special', 'move_is_status',
+    'move_type',
+})
+# DSL methods computed from the type-effectiveness table for all moves at once
+_TYPE_FEATURES = frozenset({'type_multiplier', 'gets_stab'})
+
+# Bounds of the per-move caches below, far above the number of moves in the pokedex; a process that
+# somehow exceeds them starts over rather than growing without limit
+MAX_MOVES = 4096
+MAX_STATIC_COLUMNS = 4096
+
+_enum_codes = {}
+_move_rows = {}
+_moves = []
+_move_types = []
+# (method name, constant arguments) -> [encoded values per move row, the same as an array]
+_static_columns = {}
+
+
+def _encode(value):
+    if value is None:
+        return -1.0
+    if isinstance(value, (bool, int, float)):
+        return float(value)
+    try:
+        return _enum_codes[value]
+    except KeyError:
+        code = _enum_codes[value] = float(1000 + len(_enum_codes))
+        return code
+
+
+def _trim_caches():
+    """Empties the move caches once they outgrow their bounds; move rows are only valid until then,
+    so this only runs before a batch computes any"""
+    if len(_moves) > MAX_MOVES or len(_static_columns) > MAX_STATIC_COLUMNS:
+        _move_rows.clear()
+        del _moves[:]
+        del _move_types[:]
+        _static_columns.clear()
+
+
+def _move_row(move):
+    try:
+        return _move_rows[move.id]
+    except KeyError:
+        row = _move_rows[move.id] = len(_moves)
+        _moves.append(move)
+        _move_types.append(TYPE_INDEX[move_features(move).type])
+        return row
+
+
+class Feature(object):
+    """One distinct DSL call of a tree; `call(dsl, move)` evaluates it"""
+    __slots__ = ('name', 'method', 'constants', 'uses_move', 'index', 'call')
+
+    def __init__(self, name, method, constants, uses_move, index):
+        self.name = name
+        self.method = method
+        self.constants = constants
+        self.uses_move = uses_move
+        self.index = index
+        if uses_move == ():
+            self.call = lambda dsl, move: method(dsl)
+        elif uses_move == (True,):
+            self.call = method
+        elif uses_move == (False,):
+            constant, = constants
+            self.call = lambda dsl, move: method(dsl, constant)
+        elif uses_move == (True, False):
+            constant = constants[1]
+            self.call = lambda dsl, move: method(dsl, move, constant)
+        else:
+            self.call = lambda dsl, move: method(dsl, *[move if is_move else constant
+                                                        for is_move, constant in zip(uses_move, constants)])
+
+    @property
+    def kind(self):
+        if not any(self.uses_move):
+            return 'battle'
+        elif self.name in _MOVE_STATIC:
+            return 'static'
+        elif self.name in _TYPE_FEATURES:
+            return 'type'
+        return 'move'
+
+    def static_column(self):
+        """Encoded values of a move-only feature for every move seen so far, NaN where it fails"""
+        column = _static_columns.setdefault((self.name, self.constants), [[], None])
+        values = column[0]
+        while len(values) < len(_moves):
+            try:
+                values.append(_encode(self.call(None, _moves[len(values)])))
+            except Exception:
+                values.append(np.nan)
+        if column[1] is None or len(column[1]) != len(values):
+            column[1] = np.array(values)
+        return column[1]
+
+
+class _Compiler(object):
+    def __init__(self):
+        self.features = {}
+
+    def feature(self, func_name, args):
+        arg_texts = tuple(derive(arg) for arg in args)
+        key = (derive(func_name), arg_texts)
+        if key not in self.features:
+            name = key[0][len('dsl.'):]
+            constants = tuple(None if text == 'move' else literal(text) for text in arg_texts)
+            uses_move = tuple(text == 'move' for text in arg_texts)
+            self.features[key] = Feature(name, getattr(DSL, name), constants, uses_move, len(self.features))
+        return self.features[key].index
+
+    def call(self, node):
+        func_name, *args = node.children
+        if len(args) >= 2 and args[-2].name in (RULE.NUM_COMPARATOR, RULE.ENUM_COMPARATOR):
+            *args, comparator, rhs = args
+            compare = COMPARATORS[derive(comparator)]
+            rhs = _encode(literal(derive(rhs)))
+            index = self.feature(func_name, args)
+            return lambda features: compare(features[..., index], rhs)
+        index = self.feature(func_name, args)
+        return lambda features: features[..., index] != 0
+
+    def bool(self, node):
+        if node.name == RULE.LIB_CALL:
+            return self.call(node)
+        elif node.name == RULE.AND_EXP:
+            left, right = (self.bool(child) for child in node.children)
+            return lambda features: left(features) & right(features)
+        elif node.name == RULE.OR_EXP:
+            left, right = (self.bool(child) for child in node.children)
+            return lambda features: left(features) | right(features)
+        elif node.name == RULE.NOT_EXP:
+            operand = self.bool(node.children[0])
+            return lambda features: ~operand(features)
+        elif node.name in (RULE.BOOL_EXP, RULE.BOOL):
+            return self.bool(node.children[0])
+        raise ValueError(node.name)
+
+    def statements(self, node):
+        """Returns a function mapping the feature tensor to the score deltas of a block of statements"""
+        if node.name in (RULE.IF_BLOCK, RULE.FLAT_IF_BLOCK):
+            condition = self.bool(node.children[0])
+            body_node = node.children[1]
+            if len(body_node.children) == 1 and body_node.children[0].name == RULE.CHANGE_SCORE:
+                delta = int(derive(body_node.children[0].children[0]))
+                return lambda features: condition(features) * delta
+            body = self.statements(body_node)
+            return lambda features: np.where(condition(features), body(features), 0)
+        elif node.name == RULE.CHANGE_SCORE:
+            delta = int(derive(node.children[0]))
+            return lambda features: delta
+
+        statements = [self.statements(child) for child in node.children]
+
+        def block(features):
+            score = np.zeros(features.shape[:-1])
+            for statement in statements:
+                score = score + statement(features)
+            return score
+
+        return block
+
+
+class BatchScript(Script):
+    def __init__(self, tree, features, score):
+        self.tree = tree
+        self.features = features
+        self.score = score
+        self._raw_script = None
+        kinds = {kind: [feature for feature in features if feature.kind == kind]
+                 for kind in ('battle', 'static', 'type', 'move')}
+        self._battle_features = kinds['battle']
+        self._battle_indices = [feature.index for feature in kinds['battle']]
+        self._static_features = kinds['static']
+        self._type_features = kinds['type']
+        self._move_features = kinds['move']
+
+    @property
+    def raw_script(self):
+        if self._raw_script is None:
+            self._raw_script = render_script(self.tree)[1]
+        return self._raw_script
+
+    def feature_tensor(self, battles, available_moves=None):
+        """Returns the (battles x moves x features) tensor, a (battles x moves) mask of real moves
+        and a mask of the battles whose features could not be computed"""
+        if available_moves is None:
+            available_moves = [battle.available_moves for battle in battles]
+        _trim_caches()
+        num_moves = max(map(len, available_moves), default=0)
+        tensor = np.zeros((len(battles), num_moves, len(self.features)))
+        failed = np.zeros(len(battles), dtype=bool)
+        lengths = np.array([len(moves) for moves in available_moves], dtype=np.intp)
+        mask = np.arange(num_moves) < lengths[:, None]
+        # Padding moves reuse the first move's row, and are masked out of the scores
+        move_rows = np.array([[_move_row(move) for move in moves] + [_move_row(moves[0])] * (num_moves - len(moves))
+                              for moves in available_moves], dtype=np.intp).reshape(len(battles), num_moves)
+        if self._type_features:
+            type_rows = np.array([defending_indices(battle.opponent_active_pokemon.types)
+                                  + defending_indices(battle.active_pokemon.types) for battle in battles],
+                                 dtype=np.intp).reshape(len(battles), 4)
+
+        battle_values = []
+        if self._battle_features or self._move_features:
+            for row, (battle, moves) in enumerate(zip(battles, available_moves)):
+                dsl = DSL(battle)
+                try:
+                    values = [_encode(feature.call(dsl, None)) for feature in self._battle_features]
+                    for feature in self._move_features:
+                        tensor[row, :len(moves), feature.index] = [_encode(feature.call(dsl, move)) for move in moves]
+                except Exception:
+                    values = [np.nan] * len(self._battle_features)
+                    failed[row] = True
+                battle_values.append(values)
+        battle_values = np.array(battle_values).reshape(len(battles), len(self._battle_features))
+
+        tensor[:, :, self._battle_indices] = battle_values[:, None, :]
+        for feature in self._static_features:
+            tensor[:, :, feature.index] = feature.static_column()[move_rows]
+        if self._type_features:
+            move_types = np.array(_move_types)[move_rows]
+            for feature in self._type_features:
+                if feature.name == 'type_multiplier':
+                    values = TYPE_EFFECTIVENESS[move_types, type_rows[:, 0:1], type_rows[:, 1:2]]
+                else:
+                    values = (move_types == type_rows[:, 2:3]) | (move_types == type_rows[:, 3:4])
+                tensor[:, :, feature.index] = values
+        failed |= (np.isnan(tensor) & mask[:, :, None]).any(axis=(1, 2))
+        return tensor, mask, failed
+
+    def scores(self, tensor, mask):
+        """Scores of every move, with padding moves scored -inf"""
+        scores = np.broadcast_to(self.score(tensor), mask.shape)
+        return np.where(mask, scores, -np.inf)
+
+    def choose_moves(self, battles):
+        """Picks a move (or, without available moves, a random switch) for every battle in one pass.
+
+        Battles whose features cannot all be computed get `None`.
+        """
+        available_moves = [battle.available_moves for battle in battles]
+        choices = [None] * len(battles)
+        pending = []
+        for row, (battle, moves) in enumerate(zip(battles, available_moves)):
+            if moves:
+                pending.append(row)
+            else:
+                choices[row] = random.choice(battle.available_switches)
+        if not pending:
+            return choices
+
+        tensor, mask, failed = self.feature_tensor([battles[row] for row in pending],
+                                                   [available_moves[row] for row in pending])
+        best = np.argmax(self.scores(tensor, mask), axis=1)
+        for row, index, is_failed in zip(pending, best, failed):
+            if not is_failed:
+                choices[row] = available_moves[row][index]
+        return choices
+
+    def choose_move(self, battle):
+        choice, = self.choose_moves([battle])
+        if choice is None:
+            raise ValueError("Could not compute the features of this battle")
+        return choice
+
+
+def compile_batch(root):
+    compiler = _Compiler()
+    score = compiler.statements(root)
+    features = sorted(compiler.features.values(), key=lambda feature: feature.index)
+    return BatchScript(root, features, score)
+
+
+def benchmark(num_scripts=20, num_battles=200, seed=0):
+    """Plays each script in `num_battles` concurrent simulated battles in lockstep, deciding every
+    turn's pending moves with one batch call per script, and compares the time against calling the
+    exec'd script's `choose_move` on the same states"""
+    from .simulator import BattleSimulation, MAX_TURNS
+
+    random.seed(seed)
+    rng = random.Random(seed)
+    timings = {'exec': 0.0, 'batch': 0.0, 'decisions': 0}
+
+    def _timed(backend, decide, views):
+        start = time.perf_counter()
+        choices = decide(views)
+        timings[backend] += time.perf_counter() - start
+        return choices
+
+    cache = ScriptCache()
+    for _ in range(num_scripts):
+        tree = get_random_tree()
+        script_class = cache.get(tree)
+        exec_script = script_class(tree, script_class.raw_script)
+        batch_script = compile_batch(tree)
+
+        def exec_decide(views):
+            return [exec_script.choose_move(view) if view.available_moves else None for view in views]
+
+        simulations = [BattleSimulation((exec_script, exec_script), rng=rng) for _ in range(num_battles)]
+        for turn in range(MAX_TURNS):
+            simulations = [simulation for simulation in simulations if not simulation.finished]
+            if not simulations:
+                break
+            views = [view for simulation in simulations for view in simulation.views]
+
+            # Alternate which engine goes first, since both read the same memoized turn snapshots
+            if turn % 2:
+                batch_choices = _timed('batch', batch_script.choose_moves, views)
+                exec_choices = _timed('exec', exec_decide, views)
+            else:
+                exec_choices = _timed('exec', exec_decide, views)
+                batch_choices = _timed('batch', batch_script.choose_moves, views)
+
+            for view, exec_choice, batch_choice in zip(views, exec_choices, batch_choices):
+                if view.available_moves:
+                    assert exec_choice is batch_choice
+                    timings['decisions'] += 1
+
+            for simulation, choices in zip(simulations, zip(batch_choices[0::2], batch_choices[1::2])):
+                winner = simulation.step(choices)
+                if winner is not None:
+                    simulation.finish(winner)
+
+    decisions = max(timings['decisions'], 1)
+    print(f"latency per decision: exec_tree {timings['exec'] / decisions * 1e6:8.1f} us   "
+          f"batch {timings['batch'] / decisions * 1e6:8.1f} us   ({decisions} decisions)")
+
+
+if __name__ == '__main__':
+    benchmark()
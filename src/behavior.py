@@ -0,0 +1,100 @@
+"""Behavioral fingerprints: scripts that pick the same moves are evaluated once.
+
+A `BehaviorCorpus` is a fixed set of recorded decision points (frozen copies of simulated battles
+with moves available). A script's signature is the digest of the moves it picks on every state of
+the corpus, computed in one call of the batch engine. `evaluate_distinct_behaviors` plays games only
+for one representative of each signature and shares its rating with the rest of the group.
+
+Equal signatures mean equal choices on the corpus, not everywhere; a larger corpus makes merging
+two scripts that would play differently less likely. A script whose decision fails on a state
+(e.g. a DSL call raising) is never merged with another one, since it would play a random move there.
+"""
+import collections
+import copy
+import hashlib
+import pickle
+import random
+
+from .batch import compile_batch
+from .evaluation import evaluate_population
+from .simulator import BattleSimulation, MAX_TURNS
+
+
+class _RandomAgent(object):
+    def __init__(self, rng):
+        self.rng = rng
+
+    def choose_move(self, battle):
+        return self.rng.choice(battle.available_moves + battle.available_switches)
+
+
+class BehaviorCorpus(object):
+    def __init__(self, states, max_signatures=4096):
+        self.states = states
+        self.max_signatures = max_signatures
+        # Least recently used first
+        self._signatures = collections.OrderedDict()
+
+    @classmethod
+    def build(cls, num_states=256, seed=0, record_probability=0.2):
+        """Records `num_states` decision points from simulated battles between random agents"""
+        rng = random.Random(seed)
+        states = []
+        while len(states) < num_states:
+            simulation = BattleSimulation((_RandomAgent(rng), _RandomAgent(rng)), rng=rng)
+            for _ in range(MAX_TURNS):
+                for view in simulation.views:
+                    if view.available_moves and len(states) < num_states and rng.random() < record_probability:
+                        # Copies the whole simulation behind the view, without the agents playing it
+                        states.append(copy.deepcopy(view, {id(simulation.agents): None}))
+                winner = simulation.step()
+                if winner is not None:
+                    break
+        return cls(states)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self.states, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(pickle.load(f))
+
+    def signature(self, script):
+        """Digest of the moves `script` picks on every state, cached by tree fingerprint"""
+        key = script.tree.fingerprint
+        if key in self._signatures:
+            self._signatures.move_to_end(key)
+            return self._signatures[key]
+        choices = compile_batch(script.tree).choose_moves(self.states)
+        # A failed decision is marked with the script's own fingerprint, so that it only matches itself
+        moves = ','.join(f'!{key.hex()}' if move is None else move.id for move in choices)
+        signature = self._signatures[key] = hashlib.blake2b(moves.encode(), digest_size=16).digest()
+        if len(self._signatures) > self.max_signatures:
+            self._signatures.popitem(last=False)
+        return signature
+
+    def group(self, population):
+        """Splits a population into lists of scripts with the same signature"""
+        groups = {}
+        for script in population:
+            groups.setdefault(self.signature(script), []).append(script)
+        return list(groups.values())
+
+
+async def evaluate_distinct_behaviors(population, num_games, backend, corpus, verbose=True):
+    """Like `evaluate_population`, but plays one representative per behavior signature and gives
+    every script its group's rating; returns the number of games saved"""
+    groups = corpus.group(population)
+    representatives = [group[0] for group in groups]
+    await evaluate_population(representatives, num_games, backend, verbose=verbose)
+    for representative, *duplicates in groups:
+        for script in duplicates:
+            script.rating = representative.rating
+
+    games_saved = num_games * (len(population) // 2 - len(representatives) // 2)
+    if verbose:
+        print(f"{len(representatives)} distinct behaviors among {len(population)} scripts, "
+              f"{games_saved} games saved")
+    return games_saved
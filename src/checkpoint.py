@@ -0,0 +1,275 @@
+"""Run checkpoints: every distinct genome stored once, and one small manifest row per script.
+
+A `Checkpoint` is a directory of three append-only files:
+
+- `genomes.bin`, the content-addressed genome store: the `symbols` then the `sizes` of every
+  distinct `Genome` (see `src.genome`), as little-endian uint16s, in the order they were first seen;
+- `genomes.idx`, one `GENOME_DTYPE` row per stored genome: its fingerprint, its offset in
+  `genomes.bin` (in uint16s) and its number of nodes. A genome's id is its row;
+- `manifest.bin`, one `MANIFEST_DTYPE` row per script of every saved generation: the generation,
+  the genome id, the genome ids of its parents (-1 for none) and its rating (NaN if unrated).
+
+Genomes hold symbol ids, so the directory also keeps the `genome.SYMBOLS_DIGEST` of the symbol table
+they were written with, in `symbols.digest`, and refuses to open under a different grammar.
+
+Saving a generation only writes the genomes that are not in the store yet, e.g. the offspring,
+while elites and repeated trees cost a manifest row, so disk use and load time grow with the
+number of distinct genomes rather than with the number of generations. The files are read
+through `np.memmap`, and a genome is only decoded (and compiled) when it is asked for.
+
+For analysis, `iter_scripts` yields the saved scripts of a run as `LazyScript`s, which only hold
+their genome id and rating until they are played, and `rating_stats` computes the per-generation
+quartiles and the best scripts in one pass over them, with one generation in memory at a time.
+"""
+import heapq
+import itertools
+import os
+from array import array
+from pathlib import Path
+
+import numpy as np
+from trueskill import Rating
+
+from . import genome
+from .core import exec_tree
+from .incremental import tree_key
+
+GENOME_DTYPE = np.dtype([('fingerprint', 'V16'), ('offset', '<u8'), ('length', '<u4')])
+MANIFEST_DTYPE = np.dtype([('generation', '<u4'), ('genome', '<u4'), ('parents', '<i4', 2),
+                           ('mu', '<f8'), ('sigma', '<f8')])
+
+
+def _memmap(path, dtype):
+    if not path.exists() or path.stat().st_size == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+class Checkpoint(object):
+    def __init__(self, directory, mode='a'):
+        """Opens the checkpoint in `directory`; with `mode='w'`, the manifest of an earlier run there
+        is discarded, while its genomes stay available"""
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        index = _memmap(self.directory / 'genomes.idx', GENOME_DTYPE)
+        self._check_symbols(len(index))
+        if mode == 'w':
+            open(self.directory / 'manifest.bin', 'wb').close()
+        self.ids = {bytes(fingerprint): genome_id for genome_id, fingerprint in enumerate(index['fingerprint'])}
+        self._end = int(index['offset'][-1] + 2 * index['length'][-1]) if len(index) else 0
+        self._index = self._blob = self._manifest = None
+
+    def _check_symbols(self, num_genomes):
+        path = self.directory / 'symbols.digest'
+        if path.exists():
+            if path.read_bytes() != genome.SYMBOLS_DIGEST:
+                raise ValueError(f"Checkpoint {self.directory} was written with a different grammar symbol table")
+        elif num_genomes:
+            raise ValueError(f"Checkpoint {self.directory} has no symbol table digest, so its genomes cannot be checked")
+        else:
+            path.write_bytes(genome.SYMBOLS_DIGEST)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def put(self, tree):
+        """The id of a tree's genome, stored first if it is new"""
+        encoded = tree if isinstance(tree, genome.Genome) else genome.encode(tree)
+        fingerprint = encoded.fingerprint
+        genome_id = self.ids.get(fingerprint)
+        if genome_id is None:
+            genome_id = self.ids[fingerprint] = len(self.ids)
+            # The blob is written first, so an index row always points at complete data
+            with open(self.directory / 'genomes.bin', 'ab') as f:
+                f.write(encoded.symbols.tobytes() + encoded.sizes.tobytes())
+            row = np.array([(fingerprint, self._end, len(encoded))], dtype=GENOME_DTYPE)
+            with open(self.directory / 'genomes.idx', 'ab') as f:
+                f.write(row.tobytes())
+            self._end += 2 * len(encoded)
+            self._index = self._blob = None
+        return genome_id
+
+    def genome(self, genome_id):
+        if self._index is None:
+            index = _memmap(self.directory / 'genomes.idx', GENOME_DTYPE)
+            self._index = (index['offset'].tolist(), index['length'].tolist())
+            # A plain view of the mapping, since slicing a `np.memmap` is much slower
+            self._blob = np.asarray(_memmap(self.directory / 'genomes.bin', '<u2'))
+        offset, length = self._index[0][genome_id], self._index[1][genome_id]
+        return genome.Genome(array('H', self._blob[offset:offset + length].tobytes()),
+                             array('H', self._blob[offset + length:offset + 2 * length].tobytes()))
+
+    def append_generation(self, population, parents=None):
+        """Appends a generation of scripts to the manifest, with the trees of each script's parents
+        (a pair, or None) if given, and returns its index"""
+        generation = self.generations
+        rows = np.zeros(len(population), dtype=MANIFEST_DTYPE)
+        rows['generation'] = generation
+        rows['parents'] = -1
+        for index, script in enumerate(population):
+            rows['genome'][index] = self.put(script.tree)
+            rating = getattr(script, 'rating', None)
+            rows['mu'][index], rows['sigma'][index] = (rating.mu, rating.sigma) if rating else (np.nan, np.nan)
+        for index, script_parents in enumerate(parents or ()):
+            for column, parent in enumerate(script_parents or ()):
+                rows['parents'][index, column] = self.put(parent)
+        with open(self.directory / 'manifest.bin', 'ab') as f:
+            f.write(rows.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._manifest = None
+        return generation
+
+    def manifest(self, generation=None):
+        """The manifest rows of one generation, or of all of them"""
+        if self._manifest is None:
+            self._manifest = _memmap(self.directory / 'manifest.bin', MANIFEST_DTYPE)
+        if generation is None:
+            return self._manifest
+        generations = self._manifest['generation']
+        start, end = np.searchsorted(generations, [generation, generation + 1])
+        return self._manifest[start:end]
+
+    @property
+    def generations(self):
+        manifest = self.manifest()
+        return int(manifest['generation'][-1]) + 1 if len(manifest) else 0
+
+    def iter_generation(self, generation):
+        """`LazyScript`s of the scripts of a generation, with their saved ratings"""
+        rows = self.manifest(generation)
+        for genome_id, mu, sigma in zip(rows['genome'].tolist(), rows['mu'].tolist(), rows['sigma'].tolist()):
+            yield LazyScript(self, genome_id, generation, None if np.isnan(mu) else Rating(mu, sigma))
+
+    def iter_scripts(self):
+        """`LazyScript`s of every saved script, generation by generation"""
+        for generation in range(self.generations):
+            yield from self.iter_generation(generation)
+
+    def load_generation(self, generation):
+        """The compiled scripts of a generation, with their saved ratings"""
+        scripts = []
+        for lazy in self.iter_generation(generation):
+            script = exec_tree(lazy.tree)
+            if lazy.rating is not None:
+                script.rating = lazy.rating
+            scripts.append(script)
+        return scripts
+
+
+class LazyScript(object):
+    """A saved script, compiled with `exec_tree` the first time anything but its tree, generation
+    or rating is used, e.g. when it plays"""
+
+    def __init__(self, checkpoint, genome_id, generation, rating=None):
+        self.checkpoint = checkpoint
+        self.genome_id = genome_id
+        self.generation = generation
+        self.rating = rating
+        self._tree = None
+        self._script = None
+
+    @property
+    def tree(self):
+        # Kept once decoded, since the genome caches its fingerprints (the script's key)
+        if self._tree is None:
+            self._tree = self.checkpoint.genome(self.genome_id)
+        return self._tree
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._script is None:
+            script = exec_tree(self.tree)
+            if script is None:
+                raise RuntimeError(f"Genome {self.genome_id} of {self.checkpoint.directory} does not compile")
+            self._script = script
+        return getattr(self._script, name)
+
+
+def rating_stats(scripts, top=10, ratings=None):
+    """The generations, the 75th percentile, median and 25th percentile of their ratings' `mu`, and
+    the `top` best scripts, in one pass over `scripts` in generation order.
+
+    With `ratings`, a map from tree key to rating such as `HeadToHeadInfo.ratings`, scripts are rated
+    from it instead of their own `rating`. Unrated scripts are left out; a generation without any
+    rated script gets NaN statistics.
+    """
+    xs, high, median, low = [], [], [], []
+    best = []
+    for generation, group in itertools.groupby(scripts, key=lambda script: script.generation):
+        rated = []
+        for script in group:
+            if ratings is not None:
+                script.rating = ratings.get(tree_key(script.tree))
+            if script.rating is not None:
+                rated.append(script)
+        mus = np.array([script.rating.mu for script in rated] or [np.nan])
+        xs.append(generation)
+        high.append(np.percentile(mus, 75))
+        median.append(np.median(mus))
+        low.append(np.percentile(mus, 25))
+        # Equal ratings go by generation then position, so that scripts are never compared
+        best = heapq.nlargest(top, itertools.chain(best, ((script.rating.mu, -len(xs), index, script)
+                                                          for index, script in enumerate(rated))))
+    return (np.array(xs), np.array(high), np.array(median), np.array(low)), [script for *_, script in best]
+
+
+def benchmark(directory='temp_scripts/checkpoint_benchmark', population_size=32, num_elites=2, epochs=30, seed=0):
+    """Disk use and load time of dill files per generation against a checkpoint, for a run that
+    keeps its elites and replaces the other scripts"""
+    import random
+    import shutil
+    import time
+
+    import dill
+
+    from .core import get_random_tree
+    from .persistent import freeze, mutate, crossover
+
+    random.seed(seed)
+    directory = Path(directory)
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir(parents=True)
+
+    trees = [freeze(get_random_tree()) for _ in range(population_size)]
+    generations = []
+    for _ in range(epochs):
+        generations.append(trees)
+        next_trees = list(trees[:num_elites])
+        while len(next_trees) < population_size:
+            next_trees.extend(mutate(child) for child in crossover(*random.sample(trees, 2)))
+        trees = next_trees[:population_size]
+
+    class _Saved(object):
+        def __init__(self, tree):
+            self.tree = tree
+
+    for index, trees in enumerate(generations):
+        with open(directory / f'{index}.dill', 'wb') as f:
+            dill.dump([genome.encode(tree) for tree in trees], f)
+    checkpoint = Checkpoint(directory / 'checkpoint', mode='w')
+    for trees in generations:
+        checkpoint.append_generation([_Saved(tree) for tree in trees])
+
+    start = time.perf_counter()
+    for index in range(epochs):
+        with open(directory / f'{index}.dill', 'rb') as f:
+            dill.load(f)
+    dill_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    checkpoint = Checkpoint(directory / 'checkpoint')
+    for index in range(epochs):
+        [checkpoint.genome(genome_id) for genome_id in checkpoint.manifest(index)['genome'].tolist()]
+    checkpoint_seconds = time.perf_counter() - start
+
+    dill_bytes = sum(os.path.getsize(directory / f'{index}.dill') for index in range(epochs))
+    checkpoint_bytes = sum(path.stat().st_size for path in (directory / 'checkpoint').iterdir())
+    print(f"{epochs * population_size} scripts, {len(checkpoint)} distinct genomes")
+    print(f"dill:       {dill_bytes / 1024:8.1f} KiB, loaded in {dill_seconds * 1e3:7.1f} ms")
+    print(f"checkpoint: {checkpoint_bytes / 1024:8.1f} KiB, loaded in {checkpoint_seconds * 1e3:7.1f} ms")
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,208 @@
+"""Compiles evolved trees straight into nested Python closures.
+
+This is an alternative to `exec_tree`, which renders each tree to source with `derive` and runs it
+through `compile`/`exec`. Here every node becomes a small closure bound at compile time, DSL
+methods are looked up once, and terminal literals are evaluated once per distinct string.
+Python source for a compiled script is only rendered when `raw_script` is read.
+"""
+import functools
+import operator
+import random
+import time
+
+from .core import RULE, DSL, Script, derive, get_random_tree, render_script, ScriptCache
+from . import core
+
+COMPARATORS = {
+    '<=': operator.le,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def literal(text):
+    # Terminals are plain literals or enum members (PokemonType.FIRE, Status.BRN, ...) from the grammar
+    return eval(text, vars(core))
+
+
+def _compile_call(node):
+    func_name, *args = node.children
+    comparator = None
+    if len(args) >= 2 and args[-2].name in (RULE.NUM_COMPARATOR, RULE.ENUM_COMPARATOR):
+        *args, comparator, rhs = args
+        compare = COMPARATORS[derive(comparator)]
+        rhs = literal(derive(rhs))
+
+    method = getattr(DSL, derive(func_name)[len('dsl.'):])
+    arg_texts = [derive(arg) for arg in args]
+    constants = [None if text == 'move' else literal(text) for text in arg_texts]
+
+    # The grammar only produces (), (move), (constant) and (move, constant) argument lists;
+    # fusing the call with its comparison keeps each predicate to a single closure frame
+    if not arg_texts:
+        if comparator is None:
+            return lambda dsl, move: method(dsl)
+        return lambda dsl, move: compare(method(dsl), rhs)
+    elif arg_texts == ['move']:
+        if comparator is None:
+            return method
+        return lambda dsl, move: compare(method(dsl, move), rhs)
+    elif len(arg_texts) == 1:
+        constant, = constants
+        if comparator is None:
+            return lambda dsl, move: method(dsl, constant)
+        return lambda dsl, move: compare(method(dsl, constant), rhs)
+    elif len(arg_texts) == 2 and arg_texts[0] == 'move' and arg_texts[1] != 'move':
+        constant = constants[1]
+        if comparator is None:
+            return lambda dsl, move: method(dsl, move, constant)
+        return lambda dsl, move: compare(method(dsl, move, constant), rhs)
+
+    uses_move = [text == 'move' for text in arg_texts]
+
+    def call(dsl, move):
+        return method(dsl, *[move if is_move else constant for is_move, constant in zip(uses_move, constants)])
+
+    if comparator is None:
+        return call
+    return lambda dsl, move: compare(call(dsl, move), rhs)
+
+
+def _compile_bool(node):
+    if node.name == RULE.LIB_CALL:
+        return _compile_call(node)
+    elif node.name == RULE.AND_EXP:
+        left, right = (_compile_bool(child) for child in node.children)
+        return lambda dsl, move: left(dsl, move) and right(dsl, move)
+    elif node.name == RULE.OR_EXP:
+        left, right = (_compile_bool(child) for child in node.children)
+        return lambda dsl, move: left(dsl, move) or right(dsl, move)
+    elif node.name == RULE.NOT_EXP:
+        operand = _compile_bool(node.children[0])
+        return lambda dsl, move: not operand(dsl, move)
+    elif node.name in (RULE.BOOL_EXP, RULE.BOOL):
+        return _compile_bool(node.children[0])
+    raise ValueError(node.name)
+
+
+def _compile_statements(node):
+    """Returns a closure computing the score delta of a block of statements for one move"""
+    if node.name in (RULE.IF_BLOCK, RULE.FLAT_IF_BLOCK):
+        condition = _compile_bool(node.children[0])
+        body_node = node.children[1]
+        if len(body_node.children) == 1 and body_node.children[0].name == RULE.CHANGE_SCORE:
+            delta = int(derive(body_node.children[0].children[0]))
+            return lambda dsl, move: delta if condition(dsl, move) else 0
+        body = _compile_statements(body_node)
+        return lambda dsl, move: body(dsl, move) if condition(dsl, move) else 0
+    elif node.name == RULE.CHANGE_SCORE:
+        delta = int(derive(node.children[0]))
+        return lambda dsl, move: delta
+
+    statements = tuple(_compile_statements(child) for child in node.children)
+    if len(statements) == 1:
+        return statements[0]
+
+    def block(dsl, move):
+        score = 0
+        for statement in statements:
+            score += statement(dsl, move)
+        return score
+
+    return block
+
+
+class ClosureScript(Script):
+    def __init__(self, tree, score_move):
+        self.tree = tree
+        self.score_move = score_move
+        self._raw_script = None
+
+    @property
+    def raw_script(self):
+        if self._raw_script is None:
+            self._raw_script = render_script(self.tree)[1]
+        return self._raw_script
+
+    def choose_move(self, battle):
+        available_moves = battle.available_moves
+        if not available_moves:
+            return random.choice(battle.available_switches)
+
+        dsl = DSL(battle)
+        score_move = self.score_move
+        move_scores = [score_move(dsl, move) for move in available_moves]
+        return available_moves[move_scores.index(max(move_scores))]
+
+
+def compile_tree(root):
+    return ClosureScript(root, _compile_statements(root))
+
+
+class _TimingAgent(object):
+    """Plays with the exec'd script while timing both backends on every move decision, and counts
+    the decisions where they disagree (the simulator would swallow an exception raised here)"""
+
+    def __init__(self, exec_script, closure_script, timings):
+        self.exec_script = exec_script
+        self.closure_script = closure_script
+        self.timings = timings
+
+    def _timed(self, backend, script, battle):
+        start = time.perf_counter()
+        choice = script.choose_move(battle)
+        self.timings[backend] += time.perf_counter() - start
+        return choice
+
+    def choose_move(self, battle):
+        if not battle.available_moves:
+            return self.exec_script.choose_move(battle)
+        # Alternate which backend goes first so neither benefits from warmed-up state
+        if self.timings['decisions'] % 2:
+            closure_choice = self._timed('closure', self.closure_script, battle)
+            exec_choice = self._timed('exec', self.exec_script, battle)
+        else:
+            exec_choice = self._timed('exec', self.exec_script, battle)
+            closure_choice = self._timed('closure', self.closure_script, battle)
+        if closure_choice is not exec_choice:
+            self.timings['mismatches'] += 1
+        self.timings['decisions'] += 1
+        return exec_choice
+
+
+def benchmark(num_scripts=200, num_battles=100, seed=0):
+    """Compares per-script compile time and per-decision latency of `compile_tree` and `exec_tree`"""
+    from .simulator import simulate_battle
+
+    random.seed(seed)
+    trees = [get_random_tree() for _ in range(num_scripts)]
+
+    cache = ScriptCache()
+    start = time.perf_counter()
+    exec_classes = [cache.get(tree) for tree in trees]
+    exec_scripts = [script_class(tree, script_class.raw_script) for script_class, tree in zip(exec_classes, trees)]
+    exec_compile = (time.perf_counter() - start) / num_scripts
+
+    start = time.perf_counter()
+    closure_scripts = [compile_tree(tree) for tree in trees]
+    closure_compile = (time.perf_counter() - start) / num_scripts
+
+    timings = {'exec': 0.0, 'closure': 0.0, 'decisions': 0, 'mismatches': 0}
+    agents = [_TimingAgent(*scripts, timings) for scripts in zip(exec_scripts, closure_scripts)]
+    rng = random.Random(seed)
+    for i in range(num_battles):
+        simulate_battle(agents[i % len(agents)], agents[(i + 1) % len(agents)], rng=rng)
+
+    decisions = max(timings['decisions'], 1)
+    print(f"compile per script:  exec_tree {exec_compile * 1e6:9.1f} us   "
+          f"compile_tree {closure_compile * 1e6:9.1f} us")
+    print(f"latency per decision: exec_tree {timings['exec'] / decisions * 1e6:8.1f} us   "
+          f"compile_tree {timings['closure'] / decisions * 1e6:9.1f} us   ({decisions} decisions)")
+    if timings['mismatches']:
+        raise AssertionError(f"compile_tree and exec_tree chose differently in {timings['mismatches']} decisions")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,9 +1,15 @@
+import collections
 import enum
 import typing
 import functools
+import hashlib
 import inspect
+import marshal
+import os
+import sys
 import uuid
 import random
+from pathlib import Path
 
 import anytree
 from poke_env.environment.pokemon_type import PokemonType
@@ -17,22 +23,63 @@ from .DSL import DSL, OptionalWeather, TypeMultiplier, StatValue, MovePower, Per
 
 RULE: typing.Optional[enum.Enum] = None
 GRAMMAR: typing.Optional[enum.Enum] = None
+# Names (as in the grammar, e.g. 'dsl.get_weather') of library calls that take no `move` argument
+MOVE_INDEPENDENT_CALLS: typing.FrozenSet[str] = frozenset()
 
 
 def get_node_id():
     return str(uuid.uuid4())[:8]
 
 
+def structural_fingerprint(name, child_fingerprints):
+    """Digest of a node's name and its children's digests, so equal subtrees share a fingerprint"""
+    if isinstance(name, enum.Enum):
+        label = ('R' + name.name).encode()
+    else:
+        label = ('S' + str(name)).encode()
+    digest = hashlib.blake2b(len(label).to_bytes(4, 'big') + label, digest_size=16)
+    for child_fingerprint in child_fingerprints:
+        digest.update(child_fingerprint)
+    return digest.digest()
+
+
 class Node(anytree.Node):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._id = get_node_id()
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self):
+        # Trees pickled before fingerprints existed have no cache attribute yet
+        fingerprint = getattr(self, '_fingerprint', None)
+        if fingerprint is None:
+            fingerprint = structural_fingerprint(self.name, (child.fingerprint for child in self.children))
+            self._fingerprint = fingerprint
+        return fingerprint
+
+    def _invalidate_fingerprint(self):
+        # A cached node always has cached descendants, so ancestors of an uncached node are uncached too
+        node = self
+        while node is not None and getattr(node, '_fingerprint', None) is not None:
+            node._fingerprint = None
+            node = node.parent
+
+    def _post_attach(self, parent):
+        parent._invalidate_fingerprint()
+
+    def _post_detach(self, parent):
+        parent._invalidate_fingerprint()
 
     def __eq__(self, other):
-        return anytree.RenderTree(self).by_attr() == anytree.RenderTree(other).by_attr()
+        if self is other:
+            return True
+        if not isinstance(other, Node):
+            return NotImplemented
+        return self.fingerprint == other.fingerprint
 
     def __hash__(self):
-        return str(anytree.RenderTree(self).by_attr()).__hash__()
+        return hash(self.fingerprint)
 
     def print(self, ascii_=False, call_log=False):
         def _format_node(node):
@@ -171,7 +218,7 @@ class Weighted(Sampler):
 
 
 def init():
-    global RULE, GRAMMAR
+    global RULE, GRAMMAR, MOVE_INDEPENDENT_CALLS
 
     lib_functions = inspect.getmembers(DSL, inspect.isfunction)
 
@@ -179,6 +226,7 @@ def init():
 
     dynamic_rules = [make_dynamic_rule(name, func) for name, func in lib_functions]
     dynamic_rules = [rule for rule in dynamic_rules if rule]
+    MOVE_INDEPENDENT_CALLS = frozenset(rule[0] for rule in dynamic_rules if 'move' not in rule)
 
     GRAMMAR = {
         RULE.START: [
@@ -305,29 +353,74 @@ class {0}(Script):
         return best_move
 """
 
+# Same as `script_template`, with the move-independent conditions evaluated once before the move loop
+optimized_script_template = r"""
+class {0}(Script):
+    def choose_move(self, battle: Battle):
+    
+        available_moves = battle.available_moves
+        if not available_moves:
+            return random.choice(battle.available_switches)
+            
+        dsl = DSL(battle)
+{1}
+        move_scores = []
+        for move in battle.available_moves:
+            score = 0
+{2}
+            move_scores.append(score)
+            
+        best_move = available_moves[move_scores.index(max(move_scores))]
+        return best_move
+"""
+
+_BOOL_RULES = ('BOOL_EXP', 'AND_EXP', 'OR_EXP', 'NOT_EXP', 'BOOL', 'LIB_CALL')
+
 
-def derive(node):
+def uses_move(node):
+    """Whether a boolean expression reads the move being scored"""
+    if node.name == RULE.LIB_CALL:
+        return derive(node.children[0]) not in MOVE_INDEPENDENT_CALLS
+    return any(uses_move(child) for child in node.children if not isinstance(child.name, str))
+
+
+def call_cost(node):
+    """Number of library calls a boolean expression makes per move, at most"""
+    if not uses_move(node):
+        return 0
+    elif node.name == RULE.LIB_CALL:
+        return 1
+    return sum(call_cost(child) for child in node.children)
+
+
+def derive(node, hoisted=None):
+    """Renders a tree to Python source.
+
+    Given a `hoisted` dict, also optimizes the code for the per-move loop it is placed in: each
+    maximal move-independent boolean expression is rendered once into `hoisted` (mapping its source
+    to a local variable name) and replaced by that variable, and `and`/`or` operands are reordered
+    so the cheaper one short-circuits the other. Hoisted expressions are evaluated on every turn,
+    including turns on which the unoptimized script would have skipped them.
+    """
     if isinstance(node.name, str):
         return node.name
     elif isinstance(node.name, RULE):
+        if hoisted is not None and node.name.name in _BOOL_RULES and not uses_move(node):
+            return hoisted.setdefault(derive(node), f'_h{len(hoisted)}')
         if node.name == RULE.IF_BLOCK or node.name == RULE.FLAT_IF_BLOCK:
             template = "if ({0}):\n{1}\n"
-            bool_exp = derive(node.children[0])
-            body = indent(derive(node.children[1]), 1)
+            bool_exp = derive(node.children[0], hoisted)
+            body = indent(derive(node.children[1], hoisted), 1)
             return template.format(bool_exp, body)
-        elif node.name == RULE.AND_EXP:
-            template = "({0} and {1})"
-            left = derive(node.children[0])
-            right = derive(node.children[1])
-            return template.format(left, right)
-        elif node.name == RULE.OR_EXP:
-            template = "({0} or {1})"
-            left = derive(node.children[0])
-            right = derive(node.children[1])
-            return template.format(left, right)
+        elif node.name == RULE.AND_EXP or node.name == RULE.OR_EXP:
+            template = "({0} and {1})" if node.name == RULE.AND_EXP else "({0} or {1})"
+            left, right = node.children
+            if hoisted is not None and call_cost(left) > call_cost(right):
+                left, right = right, left
+            return template.format(derive(left, hoisted), derive(right, hoisted))
         elif node.name == RULE.NOT_EXP:
             template = "not ({0})"
-            op = derive(node.children[0])
+            op = derive(node.children[0], hoisted)
             return template.format(op)
         elif node.name == RULE.CHANGE_SCORE:
             template = "score += {0}"
@@ -353,24 +446,116 @@ def derive(node):
                 func_name = derive(func_name)
                 params = ', '.join(derive(arg) for arg in args)
                 return template.format(func_name, params)
-        return ''.join(derive(child) for child in node.children)
+        return ''.join(derive(child, hoisted) for child in node.children)
+
+
+def render_script(node, script_name=None, optimize=True):
+    script_name = script_name or 'Script_' + str(uuid.uuid4()).replace('-', '')
+    if not optimize:
+        code = indent(derive(node), 3)
+        return script_name, script_template.format(script_name, code)
+    hoisted = {}
+    code = indent(derive(node, hoisted), 3)
+    hoisted_code = indent('\n'.join(f'{name} = {source}' for source, name in hoisted.items()), 2)
+    return script_name, optimized_script_template.format(script_name, hoisted_code, code)
+
+
+ScriptCacheInfo = collections.namedtuple('ScriptCacheInfo', ['hits', 'misses', 'disk_hits', 'maxsize', 'currsize'])
+
+
+class ScriptCache(object):
+    """Bounded LRU map from tree fingerprints to compiled `Script` subclasses.
+
+    When `directory` is set, compiled code objects are also marshalled to disk, so trees seen by an
+    earlier session (e.g. when reloading saved generations) skip `compile()` entirely.
+    """
+
+    def __init__(self, maxsize=4096, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._classes = collections.OrderedDict()
+
+    def info(self):
+        return ScriptCacheInfo(self.hits, self.misses, self.disk_hits, self.maxsize, len(self._classes))
+
+    def clear(self):
+        self._classes.clear()
+        self.hits = self.misses = self.disk_hits = 0
+
+    def _code_path(self, key):
+        return Path(self.directory).joinpath(sys.implementation.cache_tag, key.hex() + '.marshal')
+
+    def _load_code(self, key, raw_script):
+        if not self.directory:
+            return None
+        try:
+            stored_script, code = marshal.loads(self._code_path(key).read_bytes())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        # Rendering is cheap next to compiling; a mismatch means derive() changed since the store was written
+        return code if stored_script == raw_script else None
+
+    def _store_code(self, key, raw_script, code):
+        if not self.directory:
+            return
+        path = self._code_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        temp_path.write_bytes(marshal.dumps((raw_script, code)))
+        os.replace(temp_path, path)
+
+    def get(self, root):
+        key = root.fingerprint
+        script_class = self._classes.get(key)
+        if script_class is not None:
+            self._classes.move_to_end(key)
+            self.hits += 1
+            return script_class
+
+        self.misses += 1
+        raw_script_class, raw_script = render_script(root, 'Script_' + key.hex())
+        code = self._load_code(key, raw_script)
+        if code is not None:
+            self.disk_hits += 1
+        else:
+            code = compile(raw_script, raw_script_class, 'exec')
+            self._store_code(key, raw_script, code)
+
+        namespace = {}
+        exec(code, globals(), namespace)
+        script_class = namespace[raw_script_class]
+        script_class.raw_script = raw_script
+
+        self._classes[key] = script_class
+        if len(self._classes) > self.maxsize:
+            self._classes.popitem(last=False)
+        return script_class
 
 
-def render_script(node):
-    script_name = 'Script_' + str(uuid.uuid4()).replace('-', '')
-    code = indent(derive(node), 3)
-    return script_name, script_template.format(script_name, code)
+script_cache = ScriptCache()
 
 
-def exec_tree(root):
-    raw_script_class, raw_script = render_script(root)
+def exec_tree(root, simplify=False):
+    """Compiles a tree into a `Script`; with `simplify`, the tree is first reduced by
+    `src.simplifier.simplify` (the script keeps the original tree)"""
     try:
-        exec(raw_script)
-        script_class = eval(raw_script_class)
-        return script_class(root, raw_script)
+        tree = root
+        if simplify:
+            # Imported here since the simplifier builds on this module
+            from .simplifier import simplify as simplify_tree
+            tree = simplify_tree(root)
+        script_class = script_cache.get(tree)
+        return script_class(root, script_class.raw_script)
     except Exception as e:
         print(e)
-        print(raw_script)
+        try:
+            print(render_script(root)[1])
+        except Exception as render_error:
+            # The tree may be what failed to render in the first place
+            print(f"(could not render the script: {render_error!r})")
 
 
 def main():
@@ -0,0 +1,245 @@
+"""Population evaluation: plays scripts against each other and rates them with TrueSkill.
+
+Games are played through a pluggable backend. `ShowdownBackend` drives `PlayerWrapper`s connected
+to a local Showdown server, `SimulatorBackend` plays the same pairings in-process through
+`src.simulator`, so evaluation throughput is bound by CPU instead of websocket round-trips.
+"""
+import asyncio
+import collections
+import gc
+import math
+import random
+import sys
+import traceback
+
+import numpy as np
+from poke_env.player.player import Player
+from poke_env.player_configuration import PlayerConfiguration
+from poke_env.server_configuration import LocalhostServerConfiguration
+from poke_env.utils import to_id_str
+from tqdm.auto import tqdm
+
+from .core import get_node_id
+from .matchmaking import pair_key, random_pairing
+from .ratings import RatingTable
+from .simulator import simulate_battle
+
+
+# What evaluation keeps of one side of a finished battle: `turns` it lasted, and the number of
+# Pokemon the side had `remaining`. Only the first three fields are needed to rate a result.
+BattleRecord = collections.namedtuple('BattleRecord', ['script', 'opponent', 'won', 'turns', 'remaining'])
+
+
+def battle_record(script, opponent, battle):
+    """Extracts the `BattleRecord` of a finished battle, so the `Battle` itself can be dropped"""
+    remaining = sum(not pokemon.fainted for pokemon in battle.team.values())
+    return BattleRecord(script, opponent, battle.won, battle.turn, remaining)
+
+
+class PlayerWrapper(Player):
+    """Plays battles with scripts: the script of a battle is looked up by its tag in `scripts`, and
+    battles without one use `script`, bound to the battle on its first decision.
+
+    A player holding a single `script` plays one battle at a time; `src.pool` binds a script per
+    battle and runs up to `max_concurrent_battles` at once on one connection.
+    """
+
+    def __init__(self, server_configuration=LocalhostServerConfiguration, recorder=None, max_concurrent_battles=1):
+        super().__init__(
+            player_configuration=PlayerConfiguration(get_node_id(), None),
+            battle_format="gen7randombattle",
+            server_configuration=server_configuration,
+            max_concurrent_battles=max_concurrent_battles,
+        )
+        self.script = None
+        self.scripts = {}
+        # A `src.recorder.DecisionRecorder` appending every decision point and the order sent there
+        self.recorder = recorder
+
+    def choose_move(self, battle):
+        script = self.scripts.get(battle.battle_tag) or self.script
+        if script is None:
+            # No script was bound to this battle, e.g. one left over from an earlier evaluation
+            print(f"No script for {battle.battle_tag}, playing a random move")
+            order = self.choose_random_move(battle)
+        else:
+            self.scripts[battle.battle_tag] = script
+            try:
+                move = script.choose_move(battle)
+                order = self.create_order(move)
+            except Exception as e:
+                print(e)
+                traceback.print_exc(file=sys.stdout)
+                print(script.raw_script)
+                order = self.choose_random_move(battle)
+        if self.recorder is not None:
+            self.recorder.record(battle, order)
+        return order
+
+
+class EvaluationBackend(object):
+    """Plays a round of pairings.
+
+    `play` returns one `BattleRecord` per side of every finished battle, i.e. two per game,
+    matching the per-player `Battle` objects the Showdown path produces. `max_players` bounds how
+    many scripts can play in a round, and `concurrency` how many battles can run at once.
+    """
+    max_players = None
+    concurrency = None
+
+    async def play(self, pairs):
+        raise NotImplementedError
+
+    async def play_one(self, left, right):
+        """Plays a single pairing, as the streaming evaluation in `src.streaming` does; backends
+        that can run several of these concurrently override it"""
+        return await self.play([(left, right)])
+
+    async def play_rounds(self, chunk, num_games, pairing, verbose=False):
+        """Plays `num_games` rounds of `pairing` within `chunk` and returns each round's results.
+
+        The chunk is rated on a table of its own as it goes, so `pairing` sees the ratings of the
+        previous rounds. Backends that play a whole chunk elsewhere (see `src.parallel`) override it.
+        """
+        table = RatingTable(len(chunk))
+        slots = {id(script): slot for slot, script in enumerate(chunk)}
+        table.assign(chunk)
+
+        played = set()
+        rounds = []
+        for _ in tqdm(range(num_games), disable=not verbose):
+            pairs = pairing(chunk, played)
+            played.update(pair_key(left, right) for left, right in pairs)
+            results = await self.play(pairs)
+            table.rate_results(results, slots)
+            table.assign(chunk)
+            rounds.append(results)
+        return rounds
+
+
+class ShowdownBackend(EvaluationBackend):
+    def __init__(self, players):
+        self.players = players
+        self.player_lookup = {player.username: player for player in players}
+        self.max_players = len(players)
+        self.concurrency = len(players) // 2
+        self._idle = None
+        self._lease = None
+
+    @staticmethod
+    def _challenge(p1, p2, left, right):
+        p1.script, p2.script = left, right
+        send = p1.send_challenges(
+            opponent=to_id_str(p2.username),
+            n_challenges=1,
+            to_wait=p2.logged_in,
+        )
+        accept = p2.accept_challenges(
+            opponent=to_id_str(p1.username),
+            n_challenges=1,
+        )
+        return [send, accept]
+
+    async def _play_pair(self, p1, p2, left, right):
+        """Plays one battle and returns its records, dropping the players' `Battle`s as soon as it ends"""
+        await asyncio.gather(*self._challenge(p1, p2, left, right))
+        results = []
+        for player in (p1, p2):
+            for battle in player.battles.values():
+                oppo = self.player_lookup[battle._opponent_username]
+                results.append(battle_record(player.script, oppo.script, battle))
+            player.reset_battles()
+            player.scripts.clear()
+        return results
+
+    async def play(self, pairs):
+        if 2 * len(pairs) > len(self.players):
+            raise ValueError(f"{len(pairs)} pairs need {2 * len(pairs)} players, the backend has {len(self.players)}")
+        players = self.players[:2 * len(pairs)]
+        results = await asyncio.gather(*(
+            self._play_pair(p1, p2, left, right)
+            for (left, right), p1, p2 in zip(pairs, players[0::2], players[1::2])
+        ))
+        return [record for pair_results in results for record in pair_results]
+
+    async def play_one(self, left, right):
+        """Plays one pairing on two idle players, waiting for a pair to free up if none is idle"""
+        if self._idle is None:
+            # Created on first use, inside the running event loop
+            self._idle = asyncio.Queue()
+            self._lease = asyncio.Lock()
+            for player in self.players:
+                self._idle.put_nowait(player)
+        async with self._lease:
+            # Taken two at a time, so concurrent battles cannot each hold one player and wait forever
+            p1, p2 = await self._idle.get(), await self._idle.get()
+        try:
+            return await self._play_pair(p1, p2, left, right)
+        finally:
+            self._idle.put_nowait(p1)
+            self._idle.put_nowait(p2)
+
+
+class SimulatorBackend(EvaluationBackend):
+    """Plays pairings in-process with `src.simulator`; a seed makes team generation and battle
+    rolls reproducible (scripts still draw forced switches from the global `random` module)"""
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    async def play(self, pairs):
+        results = []
+        for left, right in pairs:
+            for_left, for_right = simulate_battle(left, right, rng=self.rng)
+            results.append(battle_record(left, right, for_left))
+            results.append(battle_record(right, left, for_right))
+        return results
+
+
+async def evaluate_population(population, num_games, backend, verbose=True, pairing=None):
+    """Plays `num_games` rounds within each chunk of `backend.max_players` scripts and rates them.
+
+    `backend.play_rounds` plays the rounds of a chunk, with `pairing` (a strategy from
+    `src.matchmaking`, shuffled neighbours by default) seeing the ratings of the previous rounds.
+    Each round's results are then rated in one batch by a `RatingTable`, in the order they were
+    played, and the ratings are set on the scripts.
+    """
+    if pairing is None:
+        pairing = random_pairing
+    table = RatingTable(len(population))
+    slots = {id(script): slot for slot, script in enumerate(population)}
+    table.assign(population)
+
+    chunk_size = backend.max_players or len(population)
+    num_chunks = int(math.ceil(len(population) / chunk_size))
+    chunks = [population[i * chunk_size: (i + 1) * chunk_size] for i in range(num_chunks)]
+
+    for chunk_idx, chunk in enumerate(chunks):
+        if num_chunks > 1:
+            print(f"chunk {chunk_idx + 1} / {num_chunks}")
+
+        for results in await backend.play_rounds(chunk, num_games, pairing, verbose):
+            table.rate_results(results, slots)
+        table.assign(population)
+
+    gc.collect()
+
+
+def ranking_agreement(population, ratings_a, ratings_b):
+    """Spearman rank correlation between two rating assignments of the same population"""
+    ranks_a = np.argsort(np.argsort([ratings_a[id(script)].mu for script in population]))
+    ranks_b = np.argsort(np.argsort([ratings_b[id(script)].mu for script in population]))
+    return np.corrcoef(ranks_a, ranks_b)[0, 1]
+
+
+async def compare_backends(population, num_games, backend_a, backend_b, verbose=True):
+    """Evaluates the population with both backends and returns the agreement of the rankings.
+
+    Showdown battles cannot be seeded server-side, so seed the simulator (and `random`) to make
+    the in-process half of the comparison repeatable.
+    """
+    ratings = []
+    for backend in (backend_a, backend_b):
+        await evaluate_population(population, num_games, backend, verbose=verbose)
+        ratings.append({id(script): script.rating for script in population})
+    return ranking_agreement(population, *ratings)
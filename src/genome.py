@@ -0,0 +1,223 @@
+"""Compact, array-backed genome representation of evolved trees.
+
+A `Genome` stores a tree as two parallel `array('H')`s in prefix order: the symbol id of every node
+(a `RULE` member or a terminal string, see `SYMBOLS`) and the size of the subtree rooted there.
+Genomes are immutable; `GenomeNode` views expose the `name`/`children` interface of `core.Node`,
+so `derive`, `render_script`, `exec_tree` and the closure compiler accept genomes directly.
+"""
+import hashlib
+import inspect
+import random
+from array import array
+
+from . import core
+from .core import RULE, DEFAULT_RULES, Node, Sampler, Diminishing, Weighted, generate_tree, structural_fingerprint
+from .DSL import DSL_ALL
+
+
+def _grammar_symbols():
+    # Library calls of every DSL category are included, so ids do not depend on the toggled category
+    symbols = {'dsl.' + name for name, _ in inspect.getmembers(DSL_ALL, inspect.isfunction) if name != '__init__'}
+
+    def _collect(production):
+        if isinstance(production, (RULE, str)):
+            symbols.add(production)
+        elif isinstance(production, list):
+            for item in production:
+                _collect(item)
+        elif isinstance(production, Diminishing):
+            _collect(production.rule)
+        elif isinstance(production, Weighted):
+            for _, rule in production.weight_rule_pairs:
+                _collect(rule)
+        elif isinstance(production, Sampler):
+            raise ValueError(f"Unknown sampler {production!r}")
+
+    for productions in core.GRAMMAR.values():
+        _collect(productions)
+    terminals = sorted(symbol for symbol in symbols if isinstance(symbol, str))
+    return [RULE[name] for name in DEFAULT_RULES] + terminals
+
+
+SYMBOLS = _grammar_symbols()
+SYMBOL_IDS = {symbol: symbol_id for symbol_id, symbol in enumerate(SYMBOLS)}
+# Pickled genomes only hold symbol ids, so they record which symbol table they were written with
+SYMBOLS_DIGEST = hashlib.blake2b(repr([str(symbol) for symbol in SYMBOLS]).encode(), digest_size=4).digest()
+
+
+class GenomeNode(object):
+    """Read-only view of one node of a `Genome`"""
+    __slots__ = ('genome', 'index')
+
+    def __init__(self, genome, index):
+        self.genome = genome
+        self.index = index
+
+    @property
+    def name(self):
+        return SYMBOLS[self.genome.symbols[self.index]]
+
+    @property
+    def children(self):
+        return tuple(GenomeNode(self.genome, index) for index in self.genome.child_indices(self.index))
+
+    @property
+    def is_leaf(self):
+        return self.genome.sizes[self.index] == 1
+
+    @property
+    def fingerprint(self):
+        return self.genome.fingerprints()[self.index]
+
+
+class Genome(object):
+    __slots__ = ('symbols', 'sizes', '_fingerprints')
+
+    def __init__(self, symbols, sizes):
+        self.symbols = symbols
+        self.sizes = sizes
+        self._fingerprints = None
+
+    def __reduce__(self):
+        return _restore_genome, (self.symbols.tobytes(), self.sizes.tobytes(), SYMBOLS_DIGEST)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __eq__(self, other):
+        if not isinstance(other, Genome):
+            return NotImplemented
+        return self.symbols == other.symbols and self.sizes == other.sizes
+
+    def __hash__(self):
+        return hash(self.fingerprint)
+
+    def child_indices(self, index):
+        child, end = index + 1, index + self.sizes[index]
+        while child < end:
+            yield child
+            child += self.sizes[child]
+
+    def parent_indices(self, index):
+        """Indices of the ancestors of a node, from the root down"""
+        ancestor = 0
+        while ancestor != index:
+            yield ancestor
+            ancestor = next(child for child in self.child_indices(ancestor)
+                            if child <= index < child + self.sizes[child])
+
+    def fingerprints(self):
+        """Fingerprints of every subtree, identical to `Node.fingerprint` of the decoded tree"""
+        if self._fingerprints is None:
+            fingerprints = [None] * len(self.symbols)
+            for index in reversed(range(len(self.symbols))):
+                fingerprints[index] = structural_fingerprint(
+                    SYMBOLS[self.symbols[index]],
+                    (fingerprints[child] for child in self.child_indices(index)),
+                )
+            self._fingerprints = fingerprints
+        return self._fingerprints
+
+    # The root node's interface, so a genome can stand in for a `core.Node` tree
+
+    @property
+    def root(self):
+        return GenomeNode(self, 0)
+
+    @property
+    def name(self):
+        return SYMBOLS[self.symbols[0]]
+
+    @property
+    def children(self):
+        return self.root.children
+
+    @property
+    def fingerprint(self):
+        return self.fingerprints()[0]
+
+    def subtree(self, index):
+        end = index + self.sizes[index]
+        return Genome(self.symbols[index:end], self.sizes[index:end])
+
+    def replace(self, index, subtree):
+        """Returns a new genome with the subtree at `index` replaced"""
+        end = index + self.sizes[index]
+        delta = len(subtree) - self.sizes[index]
+        sizes = self.sizes[:index] + subtree.sizes + self.sizes[end:]
+        for ancestor in self.parent_indices(index):
+            sizes[ancestor] += delta
+        return Genome(self.symbols[:index] + subtree.symbols + self.symbols[end:], sizes)
+
+    def derive(self):
+        return core.derive(self.root)
+
+    def print(self, ascii_=False):
+        decode(self).print(ascii_=ascii_)
+
+
+def _restore_genome(symbols, sizes, symbols_digest):
+    if symbols_digest != SYMBOLS_DIGEST:
+        raise ValueError("Genome was pickled with a different grammar symbol table")
+    genome = Genome(array('H'), array('H'))
+    genome.symbols.frombytes(symbols)
+    genome.sizes.frombytes(sizes)
+    return genome
+
+
+def encode(root):
+    """Converts a `core.Node` tree (or anything with `name`/`children`) into a `Genome`"""
+    symbols, sizes = array('H'), array('H')
+
+    def _visit(node):
+        index = len(symbols)
+        try:
+            symbols.append(SYMBOL_IDS[node.name])
+        except KeyError:
+            raise ValueError(f"{node.name!r} is not a symbol of the current grammar") from None
+        sizes.append(0)
+        for child in node.children:
+            _visit(child)
+        sizes[index] = len(symbols) - index
+
+    _visit(root)
+    return Genome(symbols, sizes)
+
+
+def decode(genome):
+    """Rebuilds the `core.Node` tree a genome was encoded from"""
+
+    def _build(index, parent):
+        node = Node(SYMBOLS[genome.symbols[index]], parent=parent)
+        for child in genome.child_indices(index):
+            _build(child, node)
+        return node
+
+    return _build(0, None)
+
+
+def get_random_genome():
+    return encode(core.get_random_tree())
+
+
+def mutate(genome):
+    """Regrows the subtree under a random node, like `generate_tree` on a cleared `core.Node`"""
+    index = random.randrange(len(genome))
+    name = SYMBOLS[genome.symbols[index]]
+    if isinstance(name, str):
+        return genome
+    return genome.replace(index, encode(generate_tree(Node(name))))
+
+
+def crossover(left, right):
+    """Swaps a random pair of subtrees whose roots share a symbol"""
+    shared = list(set(left.symbols) & set(right.symbols))
+    if not shared:
+        return left, right
+    symbol = random.choice(shared)
+    left_index = random.choice([index for index, value in enumerate(left.symbols) if value == symbol])
+    right_index = random.choice([index for index, value in enumerate(right.symbols) if value == symbol])
+    return (
+        left.replace(left_index, right.subtree(right_index)),
+        right.replace(right_index, left.subtree(left_index)),
+    )
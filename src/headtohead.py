@@ -0,0 +1,169 @@
+"""A persistent, sparse store of head-to-head results between tree keys.
+
+The analysis of a run rates the scripts of all its generations together, and used to replay all
+their games every time. A `HeadToHead` keeps, for every pair of tree keys (`tree_key`, the tree's
+structural fingerprint) that met, the wins and losses of each side, in a `.npz` file of COO
+arrays: `keys` (one 16 byte fingerprint per row), `pairs` (indices into `keys`) and `counts`
+(wins and losses of the first key of the pair). Like the results of the backends, every game
+counts once from each side, and a tie counts as a loss in the records of both sides.
+
+`evaluate_head_to_head` only plays the games a set of scripts is missing: every key plays until it
+has `num_games` stored games against the other keys of the set, against keys it has not met yet
+whenever possible. Rerunning an analysis therefore plays nothing, and adding a generation only
+plays its new scripts. Ratings are then recomputed in bulk from the stored results with a
+`RatingTable`, in an order that only depends on the stored counts, so they are reproducible.
+"""
+import collections
+import os
+import random
+from pathlib import Path
+
+import numpy as np
+
+from .incremental import tree_key
+from .ratings import RatingTable
+
+HeadToHeadInfo = collections.namedtuple('HeadToHeadInfo', ['keys', 'games_played', 'games_stored', 'ratings'])
+
+KEY_SIZE = 16
+
+
+class HeadToHead(object):
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else None
+        # key -> {opponent key: [wins, losses]}
+        self.records = collections.defaultdict(dict)
+        if self.path is not None and self.path.exists():
+            self._load()
+
+    def _load(self):
+        with np.load(self.path) as data:
+            keys = [row.tobytes() for row in data['keys']]
+            for (key, opponent), (wins, losses) in zip(data['pairs'].tolist(), data['counts'].tolist()):
+                self.records[keys[key]][keys[opponent]] = [wins, losses]
+
+    def save(self):
+        """Writes the store to its path, if any, replacing the previous file at once"""
+        if self.path is None:
+            return
+        keys = sorted(set(self.records).union(*self.records.values()))
+        index = {key: i for i, key in enumerate(keys)}
+        pairs, counts = [], []
+        for key, opponents in self.records.items():
+            for opponent, record in opponents.items():
+                pairs.append((index[key], index[opponent]))
+                counts.append(record)
+        temporary = self.path.with_name(self.path.name + '.tmp')
+        with open(temporary, 'wb') as f:
+            np.savez(
+                f,
+                keys=np.frombuffer(b''.join(keys), dtype=np.uint8).reshape(len(keys), KEY_SIZE),
+                pairs=np.array(pairs, dtype=np.int32).reshape(-1, 2),
+                counts=np.array(counts, dtype=np.int32).reshape(-1, 2),
+            )
+        os.replace(temporary, self.path)
+
+    def record(self, results, keys):
+        """Counts `(script, opponent, won, ...)` results, with `keys` mapping `id(script)` to its key"""
+        for script, opponent, won, *_ in results:
+            record = self.records[keys[id(script)]].setdefault(keys[id(opponent)], [0, 0])
+            record[0 if won else 1] += 1
+
+    def games(self, key, among):
+        """Stored games of `key` against the keys in the set `among`"""
+        return sum(wins + losses for opponent, (wins, losses) in self.records.get(key, {}).items()
+                   if opponent in among)
+
+    def ratings(self, keys):
+        """A `RatingTable` of `keys`, in order, rated with their stored results against each other"""
+        slots = {key: slot for slot, key in enumerate(keys)}
+        pairs = sorted(
+            (slots[key], slots[opponent], wins, losses)
+            for key in keys for opponent, (wins, losses) in self.records.get(key, {}).items()
+            if opponent in slots
+        )
+        # The n-th result of every pair goes in the n-th round, alternating wins and losses
+        rounds = collections.defaultdict(lambda: ([], []))
+        for slot, opponent, wins, losses in pairs:
+            outcomes = [won for n in range(max(wins, losses)) for won in (True, False)
+                        if n < (wins if won else losses)]
+            for n, won in enumerate(outcomes):
+                winners, losers = rounds[n]
+                winners.append(slot if won else opponent)
+                losers.append(opponent if won else slot)
+        table = RatingTable(len(keys))
+        for n in sorted(rounds):
+            table.rate(*rounds[n])
+        return table
+
+
+def _missing_pairs(pending, scripts, store, keys):
+    """Pairs every pending script with a script of another key it has not met if possible, none of
+    them playing twice in the round"""
+    busy = set()
+    pairs = []
+    for script in pending:
+        key = keys[id(script)]
+        if key in busy:
+            continue
+        busy.add(key)
+        met = store.records.get(key, {})
+        candidates = [other for other in scripts if keys[id(other)] not in busy]
+        if not candidates:
+            break
+        opponent = next((other for other in candidates if keys[id(other)] not in met), random.choice(candidates))
+        busy.add(keys[id(opponent)])
+        pairs.append((script, opponent))
+    return pairs
+
+
+async def evaluate_head_to_head(scripts, num_games, backend, store, verbose=True):
+    """Rates `scripts` from `store`, first playing (and storing) the games their keys are missing.
+    Scripts sharing a key share its rating.
+
+    `scripts` is only iterated once to find them, keeping one script per key, so it can be a
+    generator such as `Checkpoint.iter_scripts()`. Only the kept scripts are rated; the returned
+    `HeadToHeadInfo` maps every key to its rating, for the others.
+    """
+    # One script per key plays for all of them
+    representatives = {}
+    for script in scripts:
+        representatives.setdefault(tree_key(script.tree), script)
+    unique = list(representatives.values())
+    keys = {id(script): key for key, script in representatives.items()}
+    among = set(representatives)
+
+    pairs_per_call = (backend.max_players or len(unique)) // 2
+
+    games_played = rounds = 0
+    try:
+        while rounds < 2 * num_games:
+            pending = [script for script in unique if store.games(keys[id(script)], among) < num_games]
+            if not pending:
+                break
+            random.shuffle(pending)
+            candidates = list(unique)
+            random.shuffle(candidates)
+            pairs = _missing_pairs(pending, candidates, store, keys)
+            if not pairs:
+                break
+            for i in range(0, len(pairs), pairs_per_call):
+                store.record(await backend.play(pairs[i: i + pairs_per_call]), keys)
+            games_played += len(pairs)
+            rounds += 1
+    finally:
+        # Once, also when interrupted, so the games played so far are kept
+        if games_played:
+            store.save()
+
+    key_order = [keys[id(script)] for script in unique]
+    table = store.ratings(key_order)
+    ratings = {key: table.rating(slot) for slot, key in enumerate(key_order)}
+    for script in unique:
+        script.rating = ratings[keys[id(script)]]
+
+    info = HeadToHeadInfo(len(unique), games_played,
+                          sum(store.games(key, among) for key in among) // 2, ratings)
+    if verbose:
+        print(f"{info.keys} distinct scripts, {games_played} games played, {info.games_stored} stored")
+    return info
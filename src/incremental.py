@@ -0,0 +1,111 @@
+"""Incremental fitness: ratings and game records carried over from one generation to the next.
+
+`evaluate_population` rates every generation from scratch, so the elites kept from the previous
+one play all their games again. A `RatingArchive` remembers, for every tree key (the tree's
+structural fingerprint, equal for identical trees however they were created), its TrueSkill rating,
+the number of games it has played and its head-to-head record against every other key.
+
+`evaluate_incremental` starts every script from its archived rating and only plays scripts with
+fewer than `num_games` games, each against a random other script of the population, so most games
+are spent on new offspring and a generation's cost grows with the number of new scripts rather
+than with the population size. Opponents are rated too, which keeps carried ratings current, and
+a pending script is paired with a script it has not met yet (per the head-to-head records) when
+possible. Scripts with the same key are rated once, as one script.
+"""
+import collections
+import random
+
+from trueskill import Rating
+
+from .ratings import RatingTable
+
+IncrementalInfo = collections.namedtuple('IncrementalInfo', ['new', 'carried', 'games_played', 'games_saved'])
+
+
+def tree_key(tree):
+    return tree.fingerprint
+
+
+class RatingArchive(object):
+    def __init__(self):
+        self.ratings = {}
+        self.games = collections.Counter()
+        # (key, opponent key) -> [wins, losses] of the first key
+        self.head_to_head = collections.defaultdict(lambda: [0, 0])
+
+    def record(self, results, keys):
+        """Counts `(script, opponent, won, ...)` results, with `keys` mapping `id(script)` to its key"""
+        for script, opponent, won, *_ in results:
+            key, opponent_key = keys[id(script)], keys[id(opponent)]
+            self.games[key] += 1
+            self.head_to_head[key, opponent_key][0 if won else 1] += 1
+
+    def met(self, key, opponent_key):
+        return (key, opponent_key) in self.head_to_head
+
+
+def _pairs(pending, population, archive, keys):
+    """Pairs every pending script with a random script of the population, one it has not met yet if
+    possible, none of them playing twice in the round"""
+    opponents = list(population)
+    random.shuffle(opponents)
+    busy = set()
+    pairs = []
+    for script in pending:
+        if id(script) in busy:
+            continue
+        busy.add(id(script))
+        free = [opponent for opponent in opponents if id(opponent) not in busy]
+        if not free:
+            break
+        opponent = next((opponent for opponent in free if not archive.met(keys[id(script)], keys[id(opponent)])),
+                        free[0])
+        busy.add(id(opponent))
+        pairs.append((script, opponent))
+    return pairs
+
+
+async def evaluate_incremental(population, num_games, backend, archive, verbose=True):
+    """Rates a population like `evaluate_population`, playing only the games its scripts are
+    missing from `archive`, which is updated. Scripts sharing a key share its rating. Returns an
+    `IncrementalInfo`."""
+    keys = {id(script): tree_key(script.tree) for script in population}
+    # One script per key plays and is rated for all of them
+    representatives = {}
+    for script in population:
+        representatives.setdefault(keys[id(script)], script)
+    unique = list(representatives.values())
+    slots = {id(script): slot for slot, script in enumerate(unique)}
+    table = RatingTable.from_ratings([archive.ratings.get(keys[id(script)], Rating()) for script in unique])
+    carried = sum(archive.games[keys[id(script)]] >= num_games for script in unique)
+    pairs_per_call = (backend.max_players or len(unique)) // 2
+
+    games_played = rounds = 0
+    while rounds < 2 * num_games:
+        pending = [script for script in unique if archive.games[keys[id(script)]] < num_games]
+        if not pending:
+            break
+        random.shuffle(pending)
+        pairs = _pairs(pending, unique, archive, keys)
+        if not pairs:
+            break
+        results = []
+        for i in range(0, len(pairs), pairs_per_call):
+            results.extend(await backend.play(pairs[i: i + pairs_per_call]))
+        table.rate_results(results, slots)
+        archive.record(results, keys)
+        games_played += len(pairs)
+        rounds += 1
+
+    for slot, script in enumerate(unique):
+        archive.ratings[keys[id(script)]] = table.rating(slot)
+    for script in population:
+        script.rating = archive.ratings[keys[id(script)]]
+
+    # Against the games `evaluate_population` would play; with mostly new scripts, more can be played
+    full_games = num_games * (len(population) // 2)
+    info = IncrementalInfo(len(unique) - carried, carried, games_played, max(0, full_games - games_played))
+    if verbose:
+        print(f"{info.new} new and {info.carried} carried scripts, {games_played} games played, "
+              f"{info.games_saved} saved")
+    return info
@@ -0,0 +1,119 @@
+"""Pairing strategies for the rounds of `evaluate_population`.
+
+A strategy is called once per round as `pairing(scripts, played)`, where `played` holds the
+`pair_key` of every pair that already met, and returns the round's pairs. Ratings are updated
+between rounds, so a strategy can spend games where the ranking is still uncertain:
+
+- `random_pairing` shuffles and pairs neighbours, the default;
+- `swiss_pairing` sorts by `mu` and pairs each script with the closest one it has not met;
+- `quality_pairing` greedily picks the pairs with the highest `trueskill.quality_1vs1`, i.e. the
+  likeliest draws, whose results move the ratings the most.
+
+The last two only repeat a pair when a script has met everyone else still unpaired.
+"""
+import math
+import random
+
+import numpy as np
+import trueskill
+
+
+def pair_key(left, right):
+    return (id(left), id(right)) if id(left) < id(right) else (id(right), id(left))
+
+
+def random_pairing(scripts, played):
+    scripts = list(scripts)
+    random.shuffle(scripts)
+    return list(zip(scripts[0::2], scripts[1::2]))
+
+
+def swiss_pairing(scripts, played):
+    scripts = list(scripts)
+    # Shuffled first, so that equal ratings (e.g. in the first round) are paired at random
+    random.shuffle(scripts)
+    scripts.sort(key=lambda script: script.rating.mu, reverse=True)
+    pairs = []
+    while len(scripts) >= 2:
+        script = scripts.pop(0)
+        index = next((i for i, other in enumerate(scripts) if pair_key(script, other) not in played), 0)
+        pairs.append((script, scripts.pop(index)))
+    return pairs
+
+
+def quality_matrix(scripts):
+    """`trueskill.quality_1vs1` of every pair of scripts, under the global TrueSkill environment"""
+    beta = trueskill.global_env().beta
+    mu = np.array([script.rating.mu for script in scripts])
+    sigma_squared = np.array([script.rating.sigma ** 2 for script in scripts])
+    denominator = 2 * beta ** 2 + sigma_squared[:, None] + sigma_squared[None, :]
+    return np.sqrt(2 * beta ** 2 / denominator) * np.exp(-(mu[:, None] - mu[None, :]) ** 2 / (2 * denominator))
+
+
+def quality_pairing(scripts, played):
+    scripts = list(scripts)
+    random.shuffle(scripts)
+    quality = quality_matrix(scripts)
+    for i, left in enumerate(scripts):
+        for j, right in enumerate(scripts[i + 1:], i + 1):
+            if pair_key(left, right) in played:
+                # Below every unplayed pair, since qualities are positive
+                quality[i, j] -= 1
+    first, second = np.triu_indices(len(scripts), 1)
+    order = np.argsort(-quality[first, second], kind='stable')
+
+    paired = [False] * len(scripts)
+    pairs = []
+    for i, j in zip(first[order].tolist(), second[order].tolist()):
+        if not paired[i] and not paired[j]:
+            paired[i] = paired[j] = True
+            pairs.append((scripts[i], scripts[j]))
+            if len(pairs) == len(scripts) // 2:
+                break
+    return pairs
+
+
+PAIRINGS = {
+    'random': random_pairing,
+    'swiss': swiss_pairing,
+    'quality': quality_pairing,
+}
+
+
+def benchmark(population_size=32, max_games=8, trials=20, seed=0):
+    """Spearman correlation between true skills and ratings after each number of games per script,
+    for every pairing strategy, on normally and exponentially distributed simulated skills"""
+    import asyncio
+    import types
+
+    from .evaluation import evaluate_population
+    from .racing import SkillBackend
+
+    distributions = {
+        'normal': lambda rng: rng.gauss(0, 1),
+        'exponential': lambda rng: rng.expovariate(1),
+    }
+    random.seed(seed)
+    for distribution, draw in distributions.items():
+        rng = random.Random(seed)
+        populations = [[types.SimpleNamespace(skill=draw(rng)) for _ in range(population_size)]
+                       for _ in range(trials)]
+        print(f"{distribution} skills, {population_size} scripts, mean Spearman correlation over {trials} trials")
+        print('games ' + ''.join(f'{name:>9}' for name in PAIRINGS))
+        for num_games in range(1, max_games + 1):
+            row = []
+            for pairing in PAIRINGS.values():
+                total = 0.0
+                for population in populations:
+                    asyncio.run(evaluate_population(population, num_games, SkillBackend(rng), verbose=False,
+                                                    pairing=pairing))
+                    skills = np.argsort(np.argsort([script.skill for script in population]))
+                    ratings = np.argsort(np.argsort([script.rating.mu for script in population]))
+                    correlation = np.corrcoef(skills, ratings)[0, 1]
+                    total += 0.0 if math.isnan(correlation) else correlation
+                row.append(total / trials)
+            print(f'{num_games:>5} ' + ''.join(f'{value:>9.3f}' for value in row))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,224 @@
+"""Multi-process evaluation: spreads the population over a pool of worker processes.
+
+Every worker builds its own evaluation backend once, through a picklable factory called with the
+worker's index. For Showdown, `showdown_worker_backend` connects a fresh pool of players to the
+worker's own local server (see `ShowdownServers`), so no two workers share a server or an event
+loop. Scripts themselves cannot be pickled, so their trees are sent instead and recompiled in the
+worker through `exec_tree`, whose on-disk code store is shared between processes.
+
+`evaluate_population` sends each worker its share of a chunk once, for all of its rounds, and gets
+the records back once, so the processes only meet at the start and end of a chunk. `play` still
+shards a single round, for racing and streaming evaluation.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import multiprocessing
+import os
+import queue
+import socket
+import subprocess
+import time
+
+from poke_env.server_configuration import ServerConfiguration
+
+from . import core
+from .core import exec_tree
+from .evaluation import BattleRecord, EvaluationBackend, PlayerWrapper, ShowdownBackend, SimulatorBackend
+
+AUTHENTICATION_URL = "https://play.pokemonshowdown.com/action.php?"
+SHOWDOWN_COMMAND = ('node', 'pokemon-showdown', 'start', '--no-security', '{port}')
+
+_worker = {}
+
+
+class ShowdownServers(object):
+    """Starts one local Showdown server per port and stops them on `close`"""
+
+    def __init__(self, num_servers, showdown_path, base_port=8000, command=SHOWDOWN_COMMAND, timeout=60):
+        self.ports = [base_port + i for i in range(num_servers)]
+        self.processes = [
+            subprocess.Popen(
+                [part.format(port=port) for part in command],
+                cwd=showdown_path,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            for port in self.ports
+        ]
+        for port in self.ports:
+            _wait_for_port(port, timeout)
+
+    def close(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _wait_for_port(port, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection(('localhost', port), timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Showdown server on port {port} did not start within {timeout}s")
+            time.sleep(0.5)
+
+
+def showdown_worker_backend(worker_index, num_players, base_port=8000):
+    server_configuration = ServerConfiguration(f"localhost:{base_port + worker_index}", AUTHENTICATION_URL)
+
+    async def _create():
+        # Players start listening on creation, which needs the worker's loop to be running
+        return ShowdownBackend([PlayerWrapper(server_configuration) for _ in range(num_players)])
+
+    return _worker['loop'].run_until_complete(_create())
+
+
+def simulator_worker_backend(worker_index, seed=None):
+    return SimulatorBackend(None if seed is None else seed + worker_index)
+
+
+def _init_worker(backend_factory, worker_indices, num_workers, script_cache_directory):
+    core.script_cache.directory = script_cache_directory
+    _worker['loop'] = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker['loop'])
+    try:
+        # A timeout rather than `get_nowait`, since the indices may still be in the parent's feeder
+        worker_index = worker_indices.get(timeout=5)
+    except queue.Empty:
+        # Only the first `num_workers` workers get an index; a replacement would share the server of
+        # a live worker, whose backend assumes it has the server to itself
+        raise RuntimeError(f"No worker index left for process {os.getpid()}: all {num_workers} are taken")
+    _worker['backend'] = backend_factory(worker_index)
+
+
+def _play_shard(tree_pairs):
+    """Plays pairs of trees on this worker's backend; returns `BattleRecord`s as plain tuples, with
+    scripts replaced by their indices into the flattened `tree_pairs`"""
+    scripts = [exec_tree(tree) for pair in tree_pairs for tree in pair]
+    index_of = {id(script): index for index, script in enumerate(scripts)}
+    results = _worker['loop'].run_until_complete(
+        _worker['backend'].play(list(zip(scripts[0::2], scripts[1::2])))
+    )
+    return [(index_of[id(record.script)], index_of[id(record.opponent)]) + tuple(record[2:]) for record in results]
+
+
+def _play_rounds(trees, num_games, pairing):
+    """Plays `num_games` rounds of `pairing` within the scripts of `trees` on this worker's backend;
+    returns each round's records as in `_play_shard`, with scripts replaced by their indices into `trees`"""
+    scripts = [exec_tree(tree) for tree in trees]
+    index_of = {id(script): index for index, script in enumerate(scripts)}
+    rounds = _worker['loop'].run_until_complete(_worker['backend'].play_rounds(scripts, num_games, pairing))
+    return [
+        [(index_of[id(record.script)], index_of[id(record.opponent)]) + tuple(record[2:]) for record in results]
+        for results in rounds
+    ]
+
+
+class ProcessPoolBackend(EvaluationBackend):
+    """Evaluation backend spreading evaluation over `num_workers` processes.
+
+    `max_players` bounds the chunk size `evaluate_population` uses; for Showdown workers it should
+    be `num_workers` times the number of players each worker creates. Each worker pairs its share of
+    a chunk among itself, so `pairing` must be picklable (e.g. a module-level function).
+    """
+
+    def __init__(self, backend_factory, num_workers=None, max_players=None):
+        self.num_workers = num_workers or os.cpu_count()
+        self.max_players = max_players
+        context = multiprocessing.get_context('spawn')
+        worker_indices = context.Queue()
+        for index in range(self.num_workers):
+            worker_indices.put(index)
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            self.num_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(backend_factory, worker_indices, self.num_workers, core.script_cache.directory),
+        )
+
+    async def play(self, pairs):
+        loop = asyncio.get_event_loop()
+        shards = [pairs[i::self.num_workers] for i in range(self.num_workers)]
+        shards = [shard for shard in shards if shard]
+        futures = [
+            loop.run_in_executor(
+                self.executor, _play_shard, [(left.tree, right.tree) for left, right in shard]
+            )
+            for shard in shards
+        ]
+
+        results = []
+        for shard, shard_results in zip(shards, await asyncio.gather(*futures)):
+            scripts = [script for pair in shard for script in pair]
+            results.extend(BattleRecord(scripts[i], scripts[j], *fields) for i, j, *fields in shard_results)
+        return results
+
+    async def play_rounds(self, chunk, num_games, pairing, verbose=False):
+        """Sends every worker a share of `chunk` to play all `num_games` rounds within, and merges
+        the shares' records round by round"""
+        loop = asyncio.get_event_loop()
+        shares = [chunk[i::self.num_workers] for i in range(self.num_workers)]
+        shares = [share for share in shares if len(share) > 1]
+        futures = [
+            loop.run_in_executor(self.executor, _play_rounds, [script.tree for script in share], num_games, pairing)
+            for share in shares
+        ]
+
+        rounds = [[] for _ in range(num_games)]
+        for share, share_rounds in zip(shares, await asyncio.gather(*futures)):
+            for results, share_results in zip(rounds, share_rounds):
+                results.extend(BattleRecord(share[i], share[j], *fields) for i, j, *fields in share_results)
+        return rounds
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def showdown_pool_backend(num_workers, players_per_worker, base_port=8000):
+    """Process pool whose workers each drive `players_per_worker` players on their own server,
+    which must be listening on `base_port + worker_index` (see `ShowdownServers`)"""
+    factory = functools.partial(showdown_worker_backend, num_players=players_per_worker, base_port=base_port)
+    return ProcessPoolBackend(factory, num_workers, max_players=num_workers * players_per_worker)
+
+
+def benchmark(population_size=64, num_games=2, max_workers=None, seed=0):
+    """Battles per second of simulator workers, from one worker up to `max_workers` (by default the
+    number of CPUs), against the in-process `SimulatorBackend`"""
+    from .core import get_random_tree
+    from .evaluation import evaluate_population
+
+    max_workers = max_workers or os.cpu_count()
+    population = [exec_tree(get_random_tree(seed=seed + i)) for i in range(population_size)]
+    battles = num_games * (population_size // 2)
+
+    start = time.perf_counter()
+    asyncio.run(evaluate_population(population, num_games, SimulatorBackend(seed), verbose=False))
+    baseline = battles / (time.perf_counter() - start)
+    print(f"in-process: {baseline:7.1f} battles/s")
+
+    num_workers = 1
+    while num_workers <= max_workers:
+        backend = ProcessPoolBackend(functools.partial(simulator_worker_backend, seed=seed), num_workers)
+        # The first round also starts the workers, so it is left out of the timing
+        asyncio.run(evaluate_population(population, 1, backend, verbose=False))
+        start = time.perf_counter()
+        asyncio.run(evaluate_population(population, num_games, backend, verbose=False))
+        throughput = battles / (time.perf_counter() - start)
+        backend.close()
+        print(f"{num_workers:3} workers: {throughput:7.1f} battles/s, {throughput / baseline:5.2f}x in-process")
+        num_workers *= 2
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,143 @@
+"""Immutable trees and copy-free genetic operators.
+
+`FrozenNode` trees have no parent pointers, so a subtree can be shared by any number of trees.
+`mutate` and `crossover` never copy their inputs: they rebuild only the nodes on the path from the
+root to the edited node and share every other subtree with the parents.
+
+Every node also knows its subtree size and, once asked, how many nodes of each name its subtree
+holds. Since nodes are immutable these never go stale; a replaced path gets fresh nodes whose
+counts are merged from the (shared, already counted) siblings. Picking a random node, or a random
+node of a given name, then walks a single root-to-node path instead of scanning the tree.
+"""
+import random
+
+from .core import Node, generate_tree, structural_fingerprint
+
+
+class FrozenNode(object):
+    __slots__ = ('name', 'children', 'fingerprint', 'size', '_counts')
+
+    def __init__(self, name, children=()):
+        self.name = name
+        self.children = tuple(children)
+        self.fingerprint = structural_fingerprint(name, (child.fingerprint for child in self.children))
+        self.size = 1 + sum(child.size for child in self.children)
+        self._counts = None
+
+    @property
+    def counts(self):
+        """Number of nodes with each name in this subtree"""
+        if self._counts is None:
+            counts = {self.name: 1}
+            for child in self.children:
+                for name, count in child.counts.items():
+                    counts[name] = counts.get(name, 0) + count
+            self._counts = counts
+        return self._counts
+
+    def __reduce__(self):
+        return FrozenNode, (self.name, self.children)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, FrozenNode):
+            return NotImplemented
+        return self.fingerprint == other.fingerprint
+
+    def __hash__(self):
+        return hash(self.fingerprint)
+
+    def __repr__(self):
+        return f"FrozenNode({self.name!r}, {len(self.children)} children)"
+
+    @property
+    def is_leaf(self):
+        return not self.children
+
+    def print(self, ascii_=False):
+        thaw(self).print(ascii_=ascii_)
+
+
+def freeze(root):
+    """Converts a `core.Node` tree (or anything with `name`/`children`) into a `FrozenNode` tree"""
+    if isinstance(root, FrozenNode):
+        return root
+    return FrozenNode(root.name, (freeze(child) for child in root.children))
+
+
+def thaw(root):
+    """Rebuilds a mutable `core.Node` tree"""
+    node = Node(root.name)
+    node.children = [thaw(child) for child in root.children]
+    return node
+
+
+def iter_paths(root, path=()):
+    """Yields `(path, node)` for every node in prefix order, a path being a tuple of child indices"""
+    yield path, root
+    for index, child in enumerate(root.children):
+        yield from iter_paths(child, path + (index,))
+
+
+def find_nth(root, n, name=None):
+    """Returns `(path, node)` of the `n`-th node in prefix order, counting only nodes called `name`
+    if one is given, by descending into the one child whose subtree holds it"""
+    path = []
+    node = root
+    while True:
+        if name is None or node.name == name:
+            if n == 0:
+                return tuple(path), node
+            n -= 1
+        for index, child in enumerate(node.children):
+            count = child.size if name is None else child.counts.get(name, 0)
+            if n < count:
+                path.append(index)
+                node = child
+                break
+            n -= count
+        else:
+            raise IndexError(n)
+
+
+def replace(root, path, subtree):
+    """Returns a tree with the node at `path` replaced, copying only the nodes along `path`"""
+    if not path:
+        return subtree
+    index, *rest = path
+    children = root.children
+    return FrozenNode(root.name, children[:index] + (replace(children[index], rest, subtree),) + children[index + 1:])
+
+
+def regrow(name):
+    return freeze(generate_tree(Node(name)))
+
+
+def mutate(tree, filter_=None):
+    """Regrows the subtree under a random node; like clearing a `core.Node`'s children and calling
+    `generate_tree` on it, a terminal picked this way regrows to itself"""
+    tree = freeze(tree)
+    if filter_ is None:
+        path, target = find_nth(tree, random.randrange(tree.size))
+    else:
+        candidates = [(path, node) for path, node in iter_paths(tree) if filter_(node)]
+        if not candidates:
+            return tree
+        path, target = random.choice(candidates)
+    if isinstance(target.name, str):
+        return tree
+    return replace(tree, path, regrow(target.name))
+
+
+def crossover(left, right):
+    """Swaps a random pair of subtrees whose roots share a name"""
+    left, right = freeze(left), freeze(right)
+
+    type_intersection = list(left.counts.keys() & right.counts.keys())
+    if not type_intersection:
+        return left, right
+    type_to_swap = random.choice(type_intersection)
+    left_path, left_head = find_nth(left, random.randrange(left.counts[type_to_swap]), type_to_swap)
+    right_path, right_head = find_nth(right, random.randrange(right.counts[type_to_swap]), type_to_swap)
+    return replace(left, left_path, right_head), replace(right, right_path, left_head)
@@ -0,0 +1,152 @@
+"""A small pool of logged-in players serving any number of scripts on one Showdown server.
+
+`ShowdownBackend` needs a player (and a websocket login) per script playing at the same time, so
+populations larger than the player list are split into chunks that never play each other.
+`PooledShowdownBackend` instead runs up to `battles_per_player` battles at once on each of a few
+`PooledPlayer`s, with the script of every battle bound to its battle tag. The backend has no
+`max_players`, so `evaluate_population` rates the whole population in one pool.
+
+Starting a battle between two players takes both players' start locks (in username order, so two
+starts cannot wait on each other): with a single challenge in flight per player, the next battle
+either player creates is the one just challenged, and is bound to the player's `script`.
+
+This builds on `Player` internals of poke_env 0.0.6, the version pinned in the Pipfile: the
+`_battles` dict keyed by battle number (see `battle_key`), `_challenge`, `_challenge_queue`,
+`_accept_challenge`, `_battle_semaphore` and `_format`. Check `_start` when upgrading poke_env.
+"""
+import asyncio
+import collections
+import random
+
+from poke_env.server_configuration import LocalhostServerConfiguration
+from poke_env.utils import to_id_str
+
+from .evaluation import EvaluationBackend, PlayerWrapper, battle_record
+
+
+def battle_key(battle_tag):
+    """poke_env's key of a battle in `Player._battles`, its number: '123' for the tag
+    'battle-gen7randombattle-123', or for a message starting with '>battle-gen7randombattle-123'"""
+    return battle_tag.split('\n')[0].split('|')[0].split('-')[2]
+
+
+class PooledPlayer(PlayerWrapper):
+    def __init__(self, server_configuration=LocalhostServerConfiguration, recorder=None, max_concurrent_battles=32,
+                 max_released=1024):
+        super().__init__(server_configuration, recorder, max_concurrent_battles)
+        self.load = 0
+        self.max_released = max_released
+        self._start_lock = None
+        self._endings = {}
+        # Keys of the latest released battles, oldest first
+        self._released = collections.OrderedDict()
+
+    @property
+    def start_lock(self):
+        # Created on first use, inside the running event loop
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        return self._start_lock
+
+    def ending(self, battle_tag):
+        """A future resolved with the battle once it is finished"""
+        if battle_tag not in self._endings:
+            self._endings[battle_tag] = asyncio.get_event_loop().create_future()
+        return self._endings[battle_tag]
+
+    async def _handle_battle_message(self, message):
+        if battle_key(message) in self._released:
+            # A late message (e.g. `|deinit|` or chat) for a released battle; poke_env would wait
+            # forever for the battle to be created again
+            return
+        await super()._handle_battle_message(message)
+        battle = self._battles.get(battle_key(message))
+        if battle is not None and battle.finished:
+            ending = self.ending(battle.battle_tag)
+            if not ending.done():
+                ending.set_result(battle)
+
+    def release(self, battle):
+        """Forgets a finished battle, its script and its ending, and ignores its later messages"""
+        key = battle_key(battle.battle_tag)
+        self._battles.pop(key, None)
+        self._released[key] = None
+        if len(self._released) > self.max_released:
+            self._released.popitem(last=False)
+        self.scripts.pop(battle.battle_tag, None)
+        self._endings.pop(battle.battle_tag, None)
+
+
+class PooledShowdownBackend(EvaluationBackend):
+    def __init__(self, num_players=16, battles_per_player=32, server_configuration=LocalhostServerConfiguration,
+                 recorder=None):
+        self.players = [PooledPlayer(server_configuration, recorder, battles_per_player) for _ in range(num_players)]
+        self.battles_per_player = battles_per_player
+        self.concurrency = num_players * battles_per_player // 2
+        self._capacity = None
+
+    async def _lease(self):
+        """Two players with room for one more battle, the least loaded first"""
+        if self._capacity is None:
+            self._capacity = asyncio.Condition()
+        async with self._capacity:
+            while True:
+                free = [player for player in self.players if player.load < self.battles_per_player]
+                if len(free) >= 2:
+                    random.shuffle(free)
+                    p1, p2 = sorted(free, key=lambda player: player.load)[:2]
+                    p1.load += 1
+                    p2.load += 1
+                    return p1, p2
+                await self._capacity.wait()
+
+    async def _give_back(self, players):
+        async with self._capacity:
+            for player in players:
+                player.load -= 1
+            self._capacity.notify_all()
+
+    @staticmethod
+    async def _start(p1, p2, left, right):
+        """Starts a battle between two players and returns both sides' tags"""
+        first, second = sorted((p1, p2), key=lambda player: player.username)
+        async with first.start_lock, second.start_lock:
+            known = [set(p1._battles), set(p2._battles)]
+            p1.script, p2.script = left, right
+            await p1.logged_in.wait()
+            await p2.logged_in.wait()
+            await p1._challenge(to_id_str(p2.username), p1._format)
+            while await p2._challenge_queue.get() != to_id_str(p1.username):
+                # Left over from a challenge list that repeated an already accepted one
+                pass
+            await p2._accept_challenge(to_id_str(p1.username))
+            await p1._battle_semaphore.acquire()
+            await p2._battle_semaphore.acquire()
+            while not p2._challenge_queue.empty():
+                p2._challenge_queue.get_nowait()
+
+            tags = []
+            for player, script, before in zip((p1, p2), (left, right), known):
+                (key,) = set(player._battles) - before
+                tag = player._battles[key].battle_tag
+                player.scripts.setdefault(tag, script)
+                tags.append(tag)
+            p1.script = p2.script = None
+            return tags
+
+    async def play_one(self, left, right):
+        p1, p2 = await self._lease()
+        try:
+            tags = await self._start(p1, p2, left, right)
+            battles = await asyncio.gather(p1.ending(tags[0]), p2.ending(tags[1]))
+            results = []
+            for player, battle, script, opponent in zip((p1, p2), battles, (left, right), (right, left)):
+                results.append(battle_record(script, opponent, battle))
+                player.release(battle)
+            return results
+        finally:
+            await self._give_back((p1, p2))
+
+    async def play(self, pairs):
+        results = await asyncio.gather(*(self.play_one(left, right) for left, right in pairs))
+        return [record for pair_results in results for record in pair_results]
@@ -0,0 +1,164 @@
+"""Racing evaluation: stops playing scripts that are confidently out of the selection.
+
+Selection only reads the top of the ranking: `get_elites` keeps the best `num_elites` scripts and a
+tournament keeps its best few entrants, so a script that is certainly near the bottom never needs
+its exact rating. `evaluate_racing` rates the population after every round instead of at the end,
+and drops a script once the upper end of its TrueSkill interval, `mu + confidence * sigma`, is
+below the lower end of the `cutoff`-th best script's. The remaining scripts, the ones near or above
+the cutoff, keep playing each other until the game budget or `max_rounds` runs out, or until no
+more than `cutoff` are left.
+
+Dropped scripts keep the rating they had when they were dropped, which still orders them roughly
+for tournaments. Racing to `num_elites` drops the most scripts; `tournament_cutoff` gives the rank
+down to which tournaments are likely to need an accurate order.
+"""
+import collections
+import math
+import random
+
+from .evaluation import EvaluationBackend
+from .ratings import RatingTable
+
+RacingInfo = collections.namedtuple('RacingInfo', ['rounds', 'games_played', 'games_saved', 'dropped'])
+
+
+def _comb(n, k):
+    """`math.comb`, which needs Python 3.8"""
+    if k < 0 or k > n:
+        return 0
+    k = min(k, n - k)
+    result = 1
+    for i in range(k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+
+def tournament_cutoff(population_size, tournament_size, num_selected, probability=0.01):
+    """How many of the best scripts have at least `probability` of being selected by a tournament
+    they enter; below that rank, a script's exact rating hardly ever matters"""
+    others = population_size - 1
+    samples = _comb(others, tournament_size - 1)
+    cutoff = 0
+    for rank in range(population_size):
+        # The script is selected if fewer than `num_selected` of the other entrants rank above it
+        selected = sum(
+            _comb(rank, better) * _comb(others - rank, tournament_size - 1 - better)
+            for better in range(min(num_selected, tournament_size))
+        ) / samples
+        if selected < probability:
+            break
+        cutoff += 1
+    return cutoff
+
+
+def _boundary(population, cutoff, confidence):
+    """The lower confidence bound of the `cutoff`-th best script"""
+    lower = sorted((script.rating.mu - confidence * script.rating.sigma for script in population), reverse=True)
+    return lower[min(cutoff, len(lower)) - 1]
+
+
+async def evaluate_racing(population, num_games, backend, cutoff, confidence=1.0, budget=1.0, min_rounds=2,
+                          max_rounds=None, verbose=True):
+    """Rates a population like `evaluate_population`, racing the scripts down to those that may rank
+    in the top `cutoff`.
+
+    `budget` is the fraction of `evaluate_population`'s `num_games * len(population) // 2` games
+    that may be played, every script plays the first `min_rounds` rounds, and scripts still racing
+    play at most `max_rounds` (by default `2 * num_games`). A larger `confidence` drops scripts later.
+    Returns a `RacingInfo`.
+    """
+    table = RatingTable(len(population))
+    slots = {id(script): slot for slot, script in enumerate(population)}
+    table.assign(population)
+    if max_rounds is None:
+        max_rounds = 2 * num_games
+    full_games = num_games * (len(population) // 2)
+    budget_games = int(budget * full_games)
+    pairs_per_call = (backend.max_players or len(population)) // 2
+
+    racing = list(population)
+    games_played = rounds = 0
+    while rounds < max_rounds and len(racing) > max(cutoff, 1):
+        random.shuffle(racing)
+        # With an odd number of racers, the last one sits the round out, so dropped ratings never move
+        pairs = list(zip(racing[0::2], racing[1::2]))
+        if games_played + len(pairs) > budget_games:
+            break
+
+        for i in range(0, len(pairs), pairs_per_call):
+            table.rate_results(await backend.play(pairs[i: i + pairs_per_call]), slots)
+        table.assign(population)
+        games_played += len(pairs)
+        rounds += 1
+
+        if rounds >= min_rounds:
+            boundary = _boundary(population, cutoff, confidence)
+            racing = [script for script in racing
+                      if script.rating.mu + confidence * script.rating.sigma >= boundary]
+
+    info = RacingInfo(rounds, games_played, full_games - games_played, len(population) - len(racing))
+    if verbose:
+        print(f"{rounds} rounds, {games_played} games played, {info.games_saved} saved, "
+              f"{info.dropped} of {len(population)} scripts dropped")
+    return info
+
+
+class SkillBackend(EvaluationBackend):
+    """Plays games between objects with a hidden `skill`, won with a logistic probability"""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    async def play(self, pairs):
+        results = []
+        for left, right in pairs:
+            won = self.rng.random() < 1 / (1 + math.exp(right.skill - left.skill))
+            results.append((left, right, won))
+            results.append((right, left, not won))
+        return results
+
+
+def benchmark(population_size=32, num_games=5, num_elites=2, cutoff=None, budgets=(1.0, 0.75, 0.5),
+              confidence=1.0, trials=100, seed=0):
+    """Compares how often full evaluation and racing to the top `cutoff` (by default `num_elites`)
+    at several budgets pick the truly best `num_elites` scripts as elites, on simulated players with
+    known skills"""
+    import asyncio
+    import types
+
+    from .evaluation import evaluate_population
+
+    rng = random.Random(seed)
+    random.seed(seed)
+    if cutoff is None:
+        cutoff = num_elites
+    full_games = trials * num_games * (population_size // 2)
+    print(f"{trials} populations of {population_size}, {num_games} games each, racing to the top {cutoff}")
+
+    populations = [[types.SimpleNamespace(skill=rng.gauss(0, 1)) for _ in range(population_size)]
+                   for _ in range(trials)]
+
+    def _elites_found(population):
+        best = sorted(population, key=lambda script: script.skill, reverse=True)[:num_elites]
+        elites = sorted(population, key=lambda script: script.rating.mu, reverse=True)[:num_elites]
+        return sum(any(script is elite for elite in elites) for script in best)
+
+    found = 0
+    for population in populations:
+        asyncio.run(evaluate_population(population, num_games, SkillBackend(rng), verbose=False))
+        found += _elites_found(population)
+    print(f"full evaluation: {full_games} games, {found / (trials * num_elites):.1%} of the true elites found")
+
+    for budget in budgets:
+        found = games_played = 0
+        for population in populations:
+            info = asyncio.run(evaluate_racing(population, num_games, SkillBackend(rng), cutoff, confidence, budget,
+                                               verbose=False))
+            games_played += info.games_played
+            found += _elites_found(population)
+        print(f"racing, budget {budget:.2f}: {games_played} games, {full_games - games_played} saved, "
+              f"{found / (trials * num_elites):.1%} of the true elites found")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,155 @@
+"""TrueSkill ratings of a whole population in NumPy arrays.
+
+A `RatingTable` keeps the `mu` and `sigma` of every population slot in two arrays and applies a
+batch of 1v1 results with the closed-form TrueSkill update for two players, vectorized over the
+batch. The normal CDF is computed with the same `erfc` approximation as trueskill's default
+backend, so results match `trueskill.rate_1vs1` to floating point precision.
+
+Results are rated in order: a batch is split into waves in which no slot appears twice, and
+each result goes in the first wave after those of the earlier results sharing one of its slots.
+Every result therefore sees exactly the ratings it would see when rated one at a time, which
+`rate(..., sequential=True)` does with `trueskill.rate_1vs1` itself, for parity checks.
+"""
+import math
+
+import numpy as np
+import trueskill
+from trueskill import Rating
+
+
+def _erfc(x):
+    """trueskill's `erfc` approximation, on arrays"""
+    z = np.abs(x)
+    t = 1. / (1. + z / 2.)
+    r = t * np.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (
+        -0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (
+            -0.82215223 + t * 0.17087277)))))))))
+    return np.where(x < 0, 2. - r, r)
+
+
+def _cdf(x):
+    return 0.5 * _erfc(-x / math.sqrt(2))
+
+
+def _pdf(x):
+    return np.exp(-x * x / 2) / math.sqrt(2 * math.pi)
+
+
+def waves(winners, losers):
+    """The wave of every result, such that each slot's results keep their order and no slot
+    appears twice in a wave"""
+    next_wave = {}
+    result_waves = np.empty(len(winners), dtype=np.intp)
+    for index, (winner, loser) in enumerate(zip(winners.tolist(), losers.tolist())):
+        wave = max(next_wave.get(winner, 0), next_wave.get(loser, 0))
+        result_waves[index] = wave
+        next_wave[winner] = next_wave[loser] = wave + 1
+    return result_waves
+
+
+class RatingTable(object):
+    def __init__(self, size, env=None):
+        self.env = env or trueskill.global_env()
+        self.mu = np.full(size, float(self.env.mu))
+        self.sigma = np.full(size, float(self.env.sigma))
+        self._draw_margin = trueskill.calc_draw_margin(self.env.draw_probability, 2, self.env)
+
+    @classmethod
+    def from_ratings(cls, ratings, env=None):
+        """A table starting from existing ratings, e.g. carried over from an earlier evaluation"""
+        table = cls(len(ratings), env)
+        table.mu[:] = [rating.mu for rating in ratings]
+        table.sigma[:] = [rating.sigma for rating in ratings]
+        return table
+
+    def __len__(self):
+        return len(self.mu)
+
+    def rating(self, slot):
+        return Rating(float(self.mu[slot]), float(self.sigma[slot]))
+
+    def assign(self, population):
+        """Sets the `rating` of every script from its slot, i.e. its index in `population`"""
+        for script, mu, sigma in zip(population, self.mu.tolist(), self.sigma.tolist()):
+            script.rating = Rating(mu, sigma)
+
+    def rate(self, winners, losers, sequential=False):
+        """Rates a batch of results, given as arrays of winning and losing slots, in order"""
+        winners = np.asarray(winners, dtype=np.intp)
+        losers = np.asarray(losers, dtype=np.intp)
+        if sequential:
+            for winner, loser in zip(winners.tolist(), losers.tolist()):
+                won, lost = trueskill.rate_1vs1(self.rating(winner), self.rating(loser), env=self.env)
+                self.mu[winner], self.sigma[winner] = won.mu, won.sigma
+                self.mu[loser], self.sigma[loser] = lost.mu, lost.sigma
+            return
+        result_waves = waves(winners, losers)
+        for wave in range(result_waves.max() + 1 if len(result_waves) else 0):
+            in_wave = result_waves == wave
+            self._rate_wave(winners[in_wave], losers[in_wave])
+
+    def rate_results(self, results, slots, sequential=False):
+        """Rates `(script, opponent, won, ...)` results, with `slots` mapping `id(script)` to its
+        slot. Each side's record of a tie has `won` False, so a tie rates each side as beaten by the
+        other, one record after the other"""
+        winners = np.empty(len(results), dtype=np.intp)
+        losers = np.empty(len(results), dtype=np.intp)
+        for index, (script, opponent, won, *_) in enumerate(results):
+            if won:
+                winners[index], losers[index] = slots[id(script)], slots[id(opponent)]
+            else:
+                winners[index], losers[index] = slots[id(opponent)], slots[id(script)]
+        self.rate(winners, losers, sequential)
+
+    def _rate_wave(self, winners, losers):
+        tau_squared = self.env.tau ** 2
+        winner_variance = self.sigma[winners] ** 2 + tau_squared
+        loser_variance = self.sigma[losers] ** 2 + tau_squared
+        c = np.sqrt(2 * self.env.beta ** 2 + winner_variance + loser_variance)
+
+        x = (self.mu[winners] - self.mu[losers]) / c - self._draw_margin / c
+        denominator = _cdf(x)
+        v = np.where(denominator > 0, _pdf(x) / np.where(denominator > 0, denominator, 1), -x)
+        # trueskill raises a FloatingPointError outside of (0, 1), which only extreme gaps reach
+        w = np.clip(v * (v + x), np.finfo(float).tiny, 1 - np.finfo(float).eps)
+
+        self.mu[winners] += winner_variance / c * v
+        self.mu[losers] -= loser_variance / c * v
+        self.sigma[winners] = np.sqrt(winner_variance * (1 - winner_variance / c ** 2 * w))
+        self.sigma[losers] = np.sqrt(loser_variance * (1 - loser_variance / c ** 2 * w))
+
+
+def benchmark(population_size=960, num_games=6, seed=0):
+    """Rates the same random rounds with `trueskill.rate_1vs1` one result at a time and in batches,
+    and compares times and ratings"""
+    import time
+
+    rng = np.random.default_rng(seed)
+    rounds = []
+    for _ in range(num_games):
+        slots = rng.permutation(population_size)
+        left, right = slots[0::2], slots[1::2]
+        won = rng.random(len(left)) < 0.5
+        # Both sides of every game, as the backends report them
+        winners = np.where(won, left, right)
+        losers = np.where(won, right, left)
+        rounds.append((np.concatenate([winners, winners]), np.concatenate([losers, losers])))
+
+    timings = {}
+    tables = {}
+    for sequential in (True, False):
+        table = tables[sequential] = RatingTable(population_size)
+        start = time.perf_counter()
+        for winners, losers in rounds:
+            table.rate(winners, losers, sequential)
+        timings[sequential] = time.perf_counter() - start
+
+    results = sum(len(winners) for winners, _ in rounds)
+    print(f"{results} results for {population_size} scripts")
+    print(f"sequential: {timings[True] * 1e3:8.2f} ms   batch: {timings[False] * 1e3:8.2f} ms")
+    print(f"max difference: mu {np.abs(tables[True].mu - tables[False].mu).max():.2e}, "
+          f"sigma {np.abs(tables[True].sigma - tables[False].sigma).max():.2e}")
+
+
+if __name__ == '__main__':
+    benchmark()
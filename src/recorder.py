@@ -0,0 +1,272 @@
+"""Recording of decision points, and offline replay of them through any agent.
+
+A `DecisionRecorder` appends one line per decision point to a file, in compact JSON:
+
+    [battle_tag, turn, weather, active, opponent, moves, switches, choice]
+
+where both active Pokemon are `[species, current_hp, max_hp, status, boosts]` (boosts in
+`BOOST_ORDER`), `moves` are the available move ids, `switches` the species available to switch to,
+and `choice` the order that was sent (`'move <id>'`, `'switch <species>'` or None). Species data
+(base stats, types) comes back from the pokedex on load, so it is not stored. Files are only ever
+appended to, several runs can share one, and a path ending in `.gz` is gzip-compressed.
+
+`load_battles` rebuilds every record as a `RecordedBattle`, shaped like poke_env's `Battle` as far
+as the DSL, `Script`s and the baseline agents read it. `replay` then streams them through an agent
+with no server or simulation in the loop, which is enough for profiling, checking that a script
+still makes the recorded choices, or scoring how often a script agrees with a reference agent.
+"""
+import collections
+import gzip
+import json
+import time
+
+from poke_env.environment.move import Move
+from poke_env.environment.pokemon import Pokemon
+from poke_env.environment.status import Status
+from poke_env.environment.weather import Weather
+from poke_env.player_configuration import PlayerConfiguration
+from poke_env.server_configuration import LocalhostServerConfiguration
+
+BOOST_ORDER = ('accuracy', 'atk', 'def', 'evasion', 'spa', 'spd', 'spe')
+
+ReplayInfo = collections.namedtuple('ReplayInfo', ['decisions', 'errors', 'matches', 'seconds'])
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def choice_key(choice):
+    """`'move <id>'` or `'switch <species>'` for a `Move`, a `Pokemon` or a `Player.create_order`
+    string, None for anything else"""
+    if isinstance(choice, Move):
+        return 'move ' + choice.id
+    if isinstance(choice, Pokemon):
+        return 'switch ' + choice.species
+    if isinstance(choice, str) and choice.startswith('/choose '):
+        return choice[len('/choose '):]
+    return None
+
+
+def _encode_pokemon(pokemon):
+    status = pokemon.status.name if pokemon.status is not None else None
+    boosts = [pokemon._boosts[category] for category in BOOST_ORDER]
+    return [pokemon.species, pokemon.current_hp or 0, pokemon.max_hp or 0, status, boosts]
+
+
+def encode_battle(battle, choice=None):
+    """The record of a battle's current decision point, as a list of JSON-serializable values"""
+    weather = battle.weather.name if battle.weather is not None else None
+    return [
+        battle.battle_tag,
+        battle.turn,
+        weather,
+        _encode_pokemon(battle.active_pokemon),
+        _encode_pokemon(battle.opponent_active_pokemon),
+        [move.id for move in battle.available_moves],
+        [pokemon.species for pokemon in battle.available_switches],
+        choice_key(choice),
+    ]
+
+
+class DecisionRecorder(object):
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = _open(path, 'a')
+
+    def record(self, battle, choice=None):
+        """Appends the battle's current decision point, and the choice made there"""
+        self._file.write(json.dumps(encode_battle(battle, choice), separators=(',', ':')) + '\n')
+        self.count += 1
+
+    def flush(self):
+        """Pushes buffered records to disk. A `.gz` file still needs `close` to be complete, since
+        gzip only writes its trailer then"""
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RecordingAgent(object):
+    """Wraps an agent with a `choose_move(battle)` method (e.g. a `Script` playing in the simulator)
+    and records every decision it makes"""
+
+    def __init__(self, agent, recorder):
+        self.agent = agent
+        self.recorder = recorder
+
+    def choose_move(self, battle):
+        choice = self.agent.choose_move(battle)
+        self.recorder.record(battle, choice)
+        return choice
+
+
+class RecordedBattle(object):
+    """A recorded decision point, shaped like `poke_env.environment.battle.Battle`"""
+
+    can_mega_evolve = False
+    can_z_move = False
+    maybe_trapped = False
+    trapped = False
+
+    def __init__(self, battle_tag, turn, weather, active_pokemon, opponent_active_pokemon,
+                 available_moves, available_switches, choice):
+        self.battle_tag = battle_tag
+        self.turn = turn
+        self.weather = weather
+        self.active_pokemon = active_pokemon
+        self.opponent_active_pokemon = opponent_active_pokemon
+        self.available_moves = available_moves
+        self.available_switches = available_switches
+        self.choice = choice
+
+    @property
+    def force_switch(self):
+        return not self.available_moves
+
+
+def _decode_pokemon(species, current_hp=0, max_hp=0, status=None, boosts=None):
+    pokemon = Pokemon(species=species)
+    pokemon._current_hp = current_hp
+    pokemon._max_hp = max_hp
+    pokemon.status = Status[status] if status is not None else None
+    if boosts is not None:
+        pokemon._boosts.update(zip(BOOST_ORDER, boosts))
+    return pokemon
+
+
+def decode_battle(record, moves=None):
+    """Rebuilds a `RecordedBattle` from a record; `moves` caches `Move`s by id across records"""
+    battle_tag, turn, weather, active, opponent, move_ids, switches, choice = record
+    if moves is None:
+        moves = {}
+    available_moves = []
+    for move_id in move_ids:
+        if move_id not in moves:
+            moves[move_id] = Move(move_id)
+        available_moves.append(moves[move_id])
+    return RecordedBattle(
+        battle_tag,
+        turn,
+        Weather[weather] if weather is not None else None,
+        _decode_pokemon(*active),
+        _decode_pokemon(*opponent),
+        available_moves,
+        [_decode_pokemon(species) for species in switches],
+        choice,
+    )
+
+
+def read_records(path):
+    with _open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_battles(path, limit=None):
+    """Rebuilds the first `limit` (or all) recorded decision points of a file"""
+    moves = {}
+    battles = []
+    for record in read_records(path):
+        if limit is not None and len(battles) >= limit:
+            break
+        battles.append(decode_battle(record, moves))
+    return battles
+
+
+def offline_player(player_class, **kwargs):
+    """An instance of a poke_env `Player` subclass that never connects to a server, for `replay`"""
+    return player_class(
+        player_configuration=PlayerConfiguration('replay', None),
+        battle_format='gen7randombattle',
+        server_configuration=LocalhostServerConfiguration,
+        start_listening=False,
+        **kwargs,
+    )
+
+
+def replay(battles, agent):
+    """Yields `(battle, choice)` for every battle, with `choice` the `choice_key` of what `agent`
+    picked, or the exception it raised. `agent` is anything with a `choose_move(battle)` method
+    returning a `Move`, a `Pokemon` or an order string, e.g. a `Script` or an `offline_player`"""
+    for battle in battles:
+        try:
+            choice = choice_key(agent.choose_move(battle))
+        except Exception as e:
+            choice = e
+        yield battle, choice
+
+
+def replay_info(battles, agent):
+    """Replays every battle through `agent`; `matches` counts the choices equal to the recorded ones
+    (scripts pick forced switches at random, so only decisions with moves available are repeatable)"""
+    decisions = errors = matches = 0
+    start = time.perf_counter()
+    for battle, choice in replay(battles, agent):
+        decisions += 1
+        if isinstance(choice, Exception):
+            errors += 1
+        elif choice == battle.choice:
+            matches += 1
+    return ReplayInfo(decisions, errors, matches, time.perf_counter() - start)
+
+
+def agreement(battles, agent, reference):
+    """Fraction of decision points where `agent` picks the same as `reference`, a cheap proxy for
+    how closely a script plays like a known-good agent"""
+    same = 0
+    for (_, choice), (_, reference_choice) in zip(replay(battles, agent), replay(battles, reference)):
+        if not isinstance(choice, Exception) and choice == reference_choice:
+            same += 1
+    return same / len(battles) if battles else 0.0
+
+
+def benchmark(path='/tmp/decisions.jsonl.gz', num_battles=20, population_size=20, seed=0):
+    """Records simulated battles between random scripts, then replays them through every script"""
+    import os
+    import random
+
+    from .core import exec_tree, get_random_tree
+    from .simulator import simulate_battle
+
+    random.seed(seed)
+    rng = random.Random(seed)
+    population = [exec_tree(get_random_tree()) for _ in range(population_size)]
+
+    if os.path.exists(path):
+        os.remove(path)
+    with DecisionRecorder(path) as recorder:
+        for _ in range(num_battles):
+            left, right = rng.sample(population, 2)
+            simulate_battle(RecordingAgent(left, recorder), RecordingAgent(right, recorder), rng=rng)
+    print(f"recorded {recorder.count} decisions in {os.path.getsize(path)} bytes")
+
+    start = time.perf_counter()
+    battles = load_battles(path)
+    print(f"loaded {len(battles)} decisions in {time.perf_counter() - start:.3f}s")
+
+    decisions = errors = matches = 0
+    seconds = 0.0
+    for script in population:
+        info = replay_info(battles, script)
+        decisions += info.decisions
+        errors += info.errors
+        matches += info.matches
+        seconds += info.seconds
+    print(f"replayed {decisions} decisions in {seconds:.3f}s "
+          f"({1e6 * seconds / decisions:.1f} us/decision), {errors} errors, {matches} matching the recording")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,181 @@
+"""Static simplification of evolved trees, using the value domains of the DSL's return types.
+
+Every DSL call returns a value from a finite domain (`okay_values` in `src/DSL/dsl_types.py`, the
+members of an enum, or True/False), so a comparison can be decided by checking it against the whole
+domain: `dsl.move_accuracy(move) <= 100` always holds and `dsl.get_weather() == Weather.X` never
+does for an `X` outside the domain. Two comparisons on the same call joined by `and`/`or` are
+decided the same way, from the values satisfying each side.
+
+`simplify` then deletes the `if` blocks that can never run, inlines the bodies of those that always
+do, and merges the score changes of each block into one. Top-level statements that shift the score
+of every move equally cannot change which move wins, and are dropped too.
+
+The result is a `FrozenNode` tree for compilation only; merged score changes may fall outside the
+grammar's `SCORE_NUM` terminals, so keep the original tree for genetic operators and genomes.
+"""
+import collections
+import functools
+import typing
+
+from poke_env.environment.pokemon_type import PokemonType
+
+from .core import RULE, derive, uses_move
+from .compiler import literal, COMPARATORS
+from .DSL import DSL_ALL, OptionalWeather, TypeMultiplier, StatValue, MovePower, PercentageValue, \
+    BattleStatModifier
+from .persistent import FrozenNode, freeze
+
+_DOMAINS = {
+    TypeMultiplier: TypeMultiplier.okay_values,
+    StatValue: StatValue.okay_values,
+    MovePower: MovePower.okay_values,
+    PercentageValue: PercentageValue.okay_values,
+    BattleStatModifier: BattleStatModifier.okay_values,
+    OptionalWeather: OptionalWeather.okay_values,
+    PokemonType: frozenset(PokemonType),
+    bool: frozenset({False, True}),
+}
+
+SimplifierInfo = collections.namedtuple('SimplifierInfo', ['trees', 'nodes_before', 'nodes_after'])
+_counts = {'trees': 0, 'nodes_before': 0, 'nodes_after': 0}
+
+
+def info():
+    """Number of trees simplified so far, and their total node counts before and after"""
+    return SimplifierInfo(**_counts)
+
+
+@functools.lru_cache(maxsize=None)
+def _domain(func_name):
+    method = getattr(DSL_ALL, func_name[len('dsl.'):], None)
+    if method is None:
+        return None
+    return _DOMAINS.get(typing.get_type_hints(method).get('return'))
+
+
+def _comparison(node):
+    """Returns `(call source, domain, satisfying values)` of a library call, or None if its domain
+    is unknown"""
+    while node.name in (RULE.BOOL_EXP, RULE.BOOL):
+        node = node.children[0]
+    if node.name != RULE.LIB_CALL:
+        return None
+    func_name, *args = node.children
+    domain = _domain(derive(func_name))
+    if domain is None:
+        return None
+    if len(args) >= 2 and args[-2].name in (RULE.NUM_COMPARATOR, RULE.ENUM_COMPARATOR):
+        *args, comparator, rhs = args
+        compare = COMPARATORS[derive(comparator)]
+        rhs = literal(derive(rhs))
+        # Numeric domains never hold None, and enum domains are only compared with == and !=
+        satisfying = frozenset(value for value in domain if compare(value, rhs))
+    else:
+        satisfying = frozenset(value for value in domain if value)
+    call = derive(func_name) + '(' + ', '.join(derive(arg) for arg in args) + ')'
+    return call, domain, satisfying
+
+
+def _decide(domain, satisfying):
+    if not satisfying:
+        return False
+    if satisfying == domain:
+        return True
+    return None
+
+
+def simplify_bool(node):
+    """Returns True or False if a boolean expression is constant, otherwise a simplified `FrozenNode`"""
+    if node.name in (RULE.BOOL_EXP, RULE.BOOL):
+        operand = simplify_bool(node.children[0])
+        return operand if isinstance(operand, bool) else FrozenNode(node.name, (operand,))
+    elif node.name == RULE.LIB_CALL:
+        comparison = _comparison(node)
+        if comparison is not None:
+            _, domain, satisfying = comparison
+            decided = _decide(domain, satisfying)
+            if decided is not None:
+                return decided
+        return freeze(node)
+    elif node.name == RULE.NOT_EXP:
+        operand = simplify_bool(node.children[0])
+        return not operand if isinstance(operand, bool) else FrozenNode(node.name, (operand,))
+    elif node.name in (RULE.AND_EXP, RULE.OR_EXP):
+        is_and = node.name == RULE.AND_EXP
+        left, right = (simplify_bool(child) for child in node.children)
+        for operand, other in ((left, right), (right, left)):
+            if isinstance(operand, bool):
+                # True and x -> x, False and x -> False, True or x -> True, False or x -> x
+                return other if operand == is_and else operand
+
+        left_comparison, right_comparison = _comparison(left), _comparison(right)
+        if left_comparison and right_comparison and left_comparison[0] == right_comparison[0]:
+            _, domain, left_values = left_comparison
+            right_values = right_comparison[2]
+            satisfying = left_values & right_values if is_and else left_values | right_values
+            decided = _decide(domain, satisfying)
+            if decided is not None:
+                return decided
+            if satisfying == left_values:
+                return left
+            if satisfying == right_values:
+                return right
+        return FrozenNode(node.name, (left, right))
+    raise ValueError(node.name)
+
+
+def _change_score(delta):
+    return FrozenNode(RULE.CHANGE_SCORE, (FrozenNode(RULE.SCORE_NUM, (FrozenNode(str(delta)),)),))
+
+
+def _simplify_block(statements):
+    """Simplifies a list of statements into a new list, with all unconditional score changes merged
+    into one trailing `CHANGE_SCORE` (`derive` only ends `if` blocks with a newline)"""
+    delta = 0
+    simplified = []
+    for statement in statements:
+        if statement.name == RULE.CHANGE_SCORE:
+            delta += int(derive(statement.children[0]))
+            continue
+        condition_node, body_node = statement.children
+        condition = simplify_bool(condition_node)
+        if condition is False:
+            continue
+        body = _simplify_block(body_node.children)
+        if condition is True:
+            for inner in body:
+                if inner.name == RULE.CHANGE_SCORE:
+                    delta += int(derive(inner.children[0]))
+                else:
+                    simplified.append(inner)
+        elif body:
+            simplified.append(FrozenNode(statement.name, (condition, FrozenNode(body_node.name, body))))
+    if delta:
+        simplified.append(_change_score(delta))
+    return simplified
+
+
+def _shifts_all_moves(statement):
+    """Whether a statement adds the same amount to every move's score"""
+    if statement.name == RULE.CHANGE_SCORE:
+        return True
+    condition, body = statement.children
+    return not uses_move(condition) and all(_shifts_all_moves(inner) for inner in body.children)
+
+
+def _size(node):
+    return 1 + sum(_size(child) for child in node.children)
+
+
+def simplify(root, report=False):
+    """Returns a simplified `FrozenNode` tree choosing the same moves as `root`"""
+    statements = [statement for statement in _simplify_block(root.children) if not _shifts_all_moves(statement)]
+    simplified = FrozenNode(root.name, statements)
+
+    before, after = _size(root), simplified.size
+    _counts['trees'] += 1
+    _counts['nodes_before'] += before
+    _counts['nodes_after'] += after
+    if report:
+        print(f"simplified {before} nodes to {after}")
+    return simplified
@@ -0,0 +1,537 @@
+"""In-process approximation of gen7 random battles, used to evaluate scripts without a Showdown server.
+
+The simulator hands each side a `SimBattle`, which exposes the subset of `poke_env`'s `Battle`
+interface that the DSL, `Script.choose_move` and the baseline agents read. Pokemon and moves are
+real `poke_env` `Pokemon`/`Move` objects backed by the bundled pokedex and move data, so DSL
+predicates see exactly the values they would see against a live server.
+
+Mechanics cover what the DSL can observe: base stats, boosts, major status conditions, weather,
+STAB, type effectiveness, accuracy, crits, priority, recoil/drain/healing, self-destruction and
+forced switches on faint. Everything else (abilities, items, volatile statuses, hazards, ...)
+is left out, and moves relying on it are kept out of the generated sets.
+"""
+import functools
+import itertools
+import random
+
+from poke_env.data import MOVES, POKEDEX
+from poke_env.environment.move import Move, special_moves
+from poke_env.environment.move_category import MoveCategory
+from poke_env.environment.pokemon import Pokemon
+from poke_env.environment.pokemon_type import PokemonType
+from poke_env.environment.status import Status
+from poke_env.environment.weather import Weather
+
+from .DSL.type_chart import type_multiplier
+
+TEAM_SIZE = 6
+MOVES_PER_POKEMON = 4
+MAX_TURNS = 500
+WEATHER_DURATION = 5
+
+# Entry keys marking mechanics the simulator does not model
+_UNSUPPORTED_MOVE_KEYS = frozenset(Move._MISC_FLAGS) | {
+    'isZ', 'isNonstandard', 'isUnreleased', 'ohko', 'damage', 'volatileStatus', 'sideCondition',
+    'slotCondition', 'pseudoWeather', 'terrain', 'selfSwitch', 'forceSwitch', 'stallingMove',
+    'isFutureMove', 'stealsBoosts', 'useTargetOffensive', 'mindBlownRecoil', 'onHitSide',
+}
+_UNSUPPORTED_MOVE_FLAGS = frozenset({'charge', 'recharge'})
+_SELF_TARGETS = frozenset({'self', 'adjacentAllyOrSelf', 'allies', 'allySide'})
+
+_CRIT_CHANCES = {0: 1 / 24, 1: 1 / 8, 2: 1 / 2}
+_STATUS_IMMUNITIES = {
+    Status.BRN: {PokemonType.FIRE},
+    Status.PAR: {PokemonType.ELECTRIC},
+    Status.PSN: {PokemonType.POISON, PokemonType.STEEL},
+    Status.TOX: {PokemonType.POISON, PokemonType.STEEL},
+    Status.FRZ: {PokemonType.ICE},
+}
+_WEATHER_MODIFIERS = {
+    Weather.RAINDANCE: {PokemonType.WATER: 1.5, PokemonType.FIRE: 0.5},
+    Weather.PRIMORDIALSEA: {PokemonType.WATER: 1.5, PokemonType.FIRE: 0},
+    Weather.SUNNYDAY: {PokemonType.FIRE: 1.5, PokemonType.WATER: 0.5},
+    Weather.DESOLATELAND: {PokemonType.FIRE: 1.5, PokemonType.WATER: 0},
+}
+_WEATHER_IMMUNITIES = {
+    Weather.SANDSTORM: {PokemonType.ROCK, PokemonType.GROUND, PokemonType.STEEL},
+    Weather.HAIL: {PokemonType.ICE},
+}
+
+
+def _is_supported_move(entry):
+    if _UNSUPPORTED_MOVE_KEYS.intersection(entry) or _UNSUPPORTED_MOVE_FLAGS.intersection(entry['flags']):
+        return False
+    if 'self' in entry and set(entry['self']) - {'boosts'}:
+        return False
+    if entry['category'] == 'Status':
+        return any(key in entry for key in ('boosts', 'status', 'weather', 'heal'))
+    return entry['basePower'] > 0
+
+
+@functools.lru_cache(maxsize=None)
+def _move_pools():
+    by_type, by_category, status = {}, {}, []
+    for move_id, entry in MOVES.items():
+        if not _is_supported_move(entry):
+            continue
+        if entry['category'] == 'Status':
+            status.append(move_id)
+        else:
+            category = entry['category'].upper()
+            by_type.setdefault((entry['type'].upper(), category), []).append(move_id)
+            by_category.setdefault(category, []).append(move_id)
+    return by_type, by_category, status
+
+
+@functools.lru_cache(maxsize=None)
+def _species_pool():
+    return sorted(
+        species for species, entry in POKEDEX.items()
+        if entry['num'] > 0 and 'evos' not in entry and 'baseSpecies' not in entry
+    )
+
+
+def _random_level(base_stats):
+    """Scales levels down with base stat total, roughly like the random battle level tiers"""
+    total = sum(base_stats.values())
+    return max(70, min(100, round(100 - (total - 300) / 10)))
+
+
+def _compute_stats(base_stats, level):
+    def _stat(base):
+        return (2 * base + 31 + 21) * level // 100
+
+    stats = {name: _stat(base) + 5 for name, base in base_stats.items()}
+    stats['hp'] = _stat(base_stats['hp']) + level + 10
+    return stats
+
+
+def _random_moveset(pokemon, rng):
+    by_type, by_category, status = _move_pools()
+    preferred = 'PHYSICAL' if pokemon.base_stats['atk'] >= pokemon.base_stats['spa'] else 'SPECIAL'
+    moveset = []
+
+    for type_ in pokemon.types:
+        if type_ is None:
+            continue
+        candidates = by_type.get((type_.name, preferred)) or by_type.get(
+            (type_.name, 'PHYSICAL' if preferred == 'SPECIAL' else 'SPECIAL'), [])
+        if candidates:
+            moveset.append(rng.choice(candidates))
+
+    while len(moveset) < MOVES_PER_POKEMON:
+        if rng.random() < 0.3:
+            move_id = rng.choice(status)
+        else:
+            category = preferred if rng.random() < 0.8 else rng.choice(('PHYSICAL', 'SPECIAL'))
+            move_id = rng.choice(by_category[category])
+        if move_id not in moveset:
+            moveset.append(move_id)
+    return moveset
+
+
+class SimPokemon(Pokemon):
+    """A `Pokemon` carrying the concrete stats and counters the simulator needs"""
+
+    def __init__(self, species, level, move_ids):
+        super().__init__(species=species)
+        self._level = level
+        self._item = None
+        self._ability = None
+        self.stats = _compute_stats(self.base_stats, level)
+        self._max_hp = self._current_hp = self.stats['hp']
+        self._moves = {move_id: Move(move_id) for move_id in move_ids}
+        self.sleep_turns = 0
+        self.toxic_counter = 0
+
+    def damage(self, amount):
+        self._current_hp = max(0, self._current_hp - max(1, int(amount)))
+        if self._current_hp == 0:
+            self._faint()
+
+    def heal(self, amount):
+        if not self.fainted:
+            self._current_hp = min(self._max_hp, self._current_hp + int(amount))
+
+    def can_receive_status(self, status):
+        if self.status is not None:
+            return False
+        return not _STATUS_IMMUNITIES.get(status, set()).intersection(self.types)
+
+    def set_status(self, status, rng):
+        self.status = status
+        if status == Status.SLP:
+            self.sleep_turns = rng.randint(1, 3)
+        elif status == Status.TOX:
+            self.toxic_counter = 0
+
+    def switch_out(self):
+        self._switch_out()
+        self.toxic_counter = 0
+
+
+def random_team(rng):
+    team = []
+    for species in rng.sample(_species_pool(), TEAM_SIZE):
+        level = _random_level(POKEDEX[species]['baseStats'])
+        pokemon = SimPokemon(species, level, [])
+        pokemon._moves = {move_id: Move(move_id) for move_id in _random_moveset(pokemon, rng)}
+        team.append(pokemon)
+    return team
+
+
+class SimBattle(object):
+    """One side's view of a simulated battle, shaped like `poke_env.environment.battle.Battle`"""
+
+    can_mega_evolve = False
+    can_z_move = False
+    maybe_trapped = False
+    trapped = False
+
+    def __init__(self, simulation, side, username, opponent_username):
+        self._simulation = simulation
+        self._side = side
+        self._player_username = username
+        self._opponent_username = opponent_username
+        self._won = None
+        self._force_switch = False
+
+    @property
+    def battle_tag(self):
+        return self._simulation.battle_tag
+
+    @property
+    def player_username(self):
+        return self._player_username
+
+    @property
+    def players(self):
+        return self._player_username, self._opponent_username
+
+    @property
+    def turn(self):
+        return self._simulation.turn
+
+    @property
+    def weather(self):
+        return self._simulation.weather
+
+    @property
+    def team(self):
+        return {pokemon.species: pokemon for pokemon in self._simulation.teams[self._side]}
+
+    @property
+    def opponent_team(self):
+        return {pokemon.species: pokemon for pokemon in self._simulation.teams[1 - self._side]}
+
+    @property
+    def active_pokemon(self):
+        return self._simulation.active[self._side]
+
+    @property
+    def opponent_active_pokemon(self):
+        return self._simulation.active[1 - self._side]
+
+    @property
+    def available_moves(self):
+        if self._force_switch:
+            return []
+        moves = [move for move in self.active_pokemon.moves.values() if move.current_pp > 0]
+        return moves or [special_moves['struggle']]
+
+    @property
+    def available_switches(self):
+        return [
+            pokemon for pokemon in self._simulation.teams[self._side]
+            if not pokemon.active and not pokemon.fainted
+        ]
+
+    @property
+    def force_switch(self):
+        return self._force_switch
+
+    @property
+    def finished(self):
+        return self._simulation.finished
+
+    @property
+    def won(self):
+        return self._won
+
+    @property
+    def lost(self):
+        return self._won is False
+
+
+class BattleSimulation(object):
+    def __init__(self, agents, usernames=('p1', 'p2'), rng=None, battle_tag='sim-gen7randombattle'):
+        self.rng = rng or random.Random()
+        self.agents = agents
+        self.battle_tag = battle_tag
+        self.teams = [random_team(self.rng), random_team(self.rng)]
+        self.active = [team[0] for team in self.teams]
+        for pokemon in self.active:
+            pokemon._switch_in()
+        self.views = [
+            SimBattle(self, 0, usernames[0], usernames[1]),
+            SimBattle(self, 1, usernames[1], usernames[0]),
+        ]
+        self.turn = 0
+        self.weather = None
+        self.weather_turns = 0
+        self.finished = False
+
+    def _choose(self, side):
+        """Asks an agent for a decision and resolves it to a legal `Move` or `Pokemon`"""
+        try:
+            choice = self.agents[side].choose_move(self.views[side])
+        except AssertionError:
+            # Failed checks (e.g. the compiler's parity check) are bugs to report, not script errors
+            raise
+        except Exception:
+            # Like `PlayerWrapper` on Showdown, a script that errors plays a random move
+            choice = None
+        return self._resolve(side, choice)
+
+    def _resolve(self, side, choice):
+        view = self.views[side]
+        legal = view.available_moves + view.available_switches
+        if isinstance(choice, str):
+            choice = self._decode_order(choice, view)
+        if not any(choice is option for option in legal):
+            choice = self.rng.choice(legal)
+        return choice
+
+    @staticmethod
+    def _decode_order(order, view):
+        """Maps a `Player.create_order` string back to the move or switch it names"""
+        _, kind, *target = order.split()
+        target = ' '.join(target)
+        if kind == 'move':
+            return next((move for move in view.available_moves if move.id == target), None)
+        return next((pokemon for pokemon in view.available_switches if pokemon.species == target), None)
+
+    def _switch(self, side, pokemon):
+        self.active[side].switch_out()
+        self.active[side] = pokemon
+        pokemon._switch_in()
+
+    def _effective_speed(self, side):
+        pokemon = self.active[side]
+        speed = pokemon.stats['spe'] * _boost_multiplier(pokemon._boosts['spe'])
+        if pokemon.status == Status.PAR:
+            speed *= 0.5
+        return speed
+
+    def _order(self, choices):
+        def _key(side):
+            choice = choices[side]
+            priority = 7 if isinstance(choice, Pokemon) else choice.priority
+            return priority, self._effective_speed(side), self.rng.random()
+
+        return sorted((0, 1), key=_key, reverse=True)
+
+    def play_turn(self, choices=None):
+        self.turn += 1
+        if choices is None:
+            choices = [self._choose(0), self._choose(1)]
+        else:
+            choices = [self._resolve(side, choice) for side, choice in enumerate(choices)]
+        for side in self._order(choices):
+            choice = choices[side]
+            if isinstance(choice, Pokemon):
+                self._switch(side, choice)
+            else:
+                self._use_move(side, choice)
+        self._end_of_turn()
+
+    def _can_act(self, user):
+        if user.status == Status.SLP:
+            user.sleep_turns -= 1
+            if user.sleep_turns > 0:
+                return False
+            user.status = None
+        elif user.status == Status.FRZ:
+            if self.rng.random() >= 0.2:
+                return False
+            user.status = None
+        elif user.status == Status.PAR and self.rng.random() < 0.25:
+            return False
+        return True
+
+    def _hits(self, move, user, target):
+        accuracy = move.entry['accuracy']
+        if accuracy is True:
+            return True
+        stage = max(-6, min(6, user._boosts['accuracy'] - target._boosts['evasion']))
+        return self.rng.random() < move.accuracy * _accuracy_multiplier(stage)
+
+    def _use_move(self, side, move):
+        user, target = self.active[side], self.active[1 - side]
+        if user.fainted or not self._can_act(user):
+            return
+        if move is not special_moves['struggle']:
+            move.use()
+
+        if move.weather:
+            self.weather, self.weather_turns = move.weather, WEATHER_DURATION
+        elif target.fainted or not self._hits(move, user, target):
+            pass
+        elif move.category == MoveCategory.STATUS:
+            self._apply_status_move(move, user, target)
+        else:
+            self._apply_damaging_move(move, user, target)
+
+        if move.self_destruct == 'always' or (move.self_destruct == 'ifHit' and not target.fainted):
+            user.damage(user.current_hp)
+
+    def _apply_status_move(self, move, user, target):
+        if move.boosts:
+            _apply_boosts(user if move.target in _SELF_TARGETS else target, move.boosts)
+        if move.status and target.can_receive_status(move.status):
+            target.set_status(move.status, self.rng)
+        if move.heal:
+            user.heal(user.max_hp * move.heal)
+        if move.self_boost:
+            _apply_boosts(user, move.self_boost)
+
+    def _apply_damaging_move(self, move, user, target):
+        multiplier = type_multiplier(move.type, target.types)
+        if multiplier == 0:
+            return
+        hits = self.rng.randint(*move.n_hit)
+        total = 0
+        for _ in range(hits):
+            damage = self._damage(move, user, target, multiplier)
+            target.damage(damage)
+            total += damage
+            if target.fainted:
+                break
+
+        if move.drain:
+            user.heal(total * move.drain)
+        if move.recoil:
+            user.damage(total * move.recoil)
+        for secondary in _secondaries(move):
+            if self.rng.random() * 100 >= secondary.get('chance', 100):
+                continue
+            status = secondary.get('status')
+            if status and not target.fainted and target.can_receive_status(Status[status.upper()]):
+                target.set_status(Status[status.upper()], self.rng)
+            if secondary.get('boosts') and not target.fainted:
+                _apply_boosts(target, secondary['boosts'])
+            if secondary.get('self', {}).get('boosts'):
+                _apply_boosts(user, secondary['self']['boosts'])
+        if move.self_boost:
+            _apply_boosts(user, move.self_boost)
+
+    def _damage(self, move, user, target, multiplier):
+        crit = self.rng.random() < _CRIT_CHANCES.get(move.crit_ratio, 1)
+        if move.category == MoveCategory.PHYSICAL:
+            attack_stat, defense_stat = 'atk', 'def'
+        else:
+            attack_stat, defense_stat = 'spa', 'spd'
+        if move.defensive_category == MoveCategory.PHYSICAL:
+            defense_stat = 'def'
+
+        attack_boost, defense_boost = user._boosts[attack_stat], target._boosts[defense_stat]
+        if crit:
+            attack_boost, defense_boost = max(attack_boost, 0), min(defense_boost, 0)
+        attack = user.stats[attack_stat] * _boost_multiplier(attack_boost)
+        defense = target.stats[defense_stat] * _boost_multiplier(defense_boost)
+
+        damage = ((2 * user.level // 5 + 2) * move.base_power * attack / defense) // 50 + 2
+        damage *= _WEATHER_MODIFIERS.get(self.weather, {}).get(move.type, 1)
+        damage *= 1.5 if crit else 1
+        damage *= self.rng.randint(85, 100) / 100
+        damage *= 1.5 if move.type in user.types else 1
+        damage *= multiplier
+        if user.status == Status.BRN and move.category == MoveCategory.PHYSICAL:
+            damage *= 0.5
+        return damage
+
+    def _end_of_turn(self):
+        for pokemon in self.active:
+            if pokemon.fainted:
+                continue
+            immune = _WEATHER_IMMUNITIES.get(self.weather)
+            if immune is not None and not immune.intersection(pokemon.types):
+                pokemon.damage(pokemon.max_hp / 16)
+            if pokemon.status == Status.BRN:
+                pokemon.damage(pokemon.max_hp / 16)
+            elif pokemon.status == Status.PSN:
+                pokemon.damage(pokemon.max_hp / 8)
+            elif pokemon.status == Status.TOX:
+                pokemon.toxic_counter += 1
+                pokemon.damage(pokemon.max_hp * pokemon.toxic_counter / 16)
+
+        if self.weather is not None and self.weather_turns:
+            self.weather_turns -= 1
+            if not self.weather_turns:
+                self.weather = None
+
+    def _replace_fainted(self):
+        for side in (0, 1):
+            view = self.views[side]
+            if self.active[side].fainted and view.available_switches:
+                view._force_switch = True
+                self._switch(side, self._choose(side))
+                view._force_switch = False
+
+    def _winner(self):
+        alive = [any(not pokemon.fainted for pokemon in team) for team in self.teams]
+        if all(alive):
+            return None
+        return alive.index(True) if any(alive) else -1
+
+    def step(self, choices=None):
+        """Plays one turn, using the given per-side `choices` instead of asking the agents if any,
+        and replaces fainted Pokemon; returns the winning side once the battle is decided"""
+        self.play_turn(choices)
+        winner = self._winner()
+        if winner is None:
+            self._replace_fainted()
+        return winner
+
+    def finish(self, winner):
+        self.finished = True
+        for side, view in enumerate(self.views):
+            view._won = None if winner in (None, -1) else winner == side
+        return self.views
+
+    def run(self, max_turns=MAX_TURNS):
+        winner = None
+        for _ in itertools.repeat(None, max_turns):
+            winner = self.step()
+            if winner is not None:
+                break
+        return self.finish(winner)
+
+
+def _boost_multiplier(stage):
+    return (2 + max(stage, 0)) / (2 - min(stage, 0))
+
+
+def _accuracy_multiplier(stage):
+    return (3 + max(stage, 0)) / (3 - min(stage, 0))
+
+
+def _apply_boosts(pokemon, boosts):
+    for stat, amount in boosts.items():
+        pokemon._boost(stat, amount)
+
+
+def _secondaries(move):
+    secondary = move.secondary
+    if secondary is None:
+        return []
+    return secondary if isinstance(secondary, list) else [secondary]
+
+
+def simulate_battle(first, second, usernames=('p1', 'p2'), rng=None):
+    """Plays one battle between two agents and returns both sides' finished `SimBattle` views.
+
+    Agents only need a `choose_move(battle)` method; it may return a `Move`, a `Pokemon` or an
+    order string as built by `Player.create_order`, so `Script`s and `Player`s both work.
+    """
+    return BattleSimulation((first, second), usernames, rng).run()
@@ -0,0 +1,150 @@
+"""Streaming evaluation: battles start as soon as two scripts are free, with no rounds.
+
+`evaluate_population` plays in rounds, so every round waits for its slowest battle while the
+players of all the others sit idle. `evaluate_streaming` keeps up to `max_concurrent` battles in
+flight (a bounded semaphore), each played with the backend's `play_one`. When a battle finishes,
+its results are rated right away and both scripts go back to the pool of free scripts, to be
+paired at random with the next free script that still has games to play. Every script plays
+`num_games` games, except possibly the last ones, which can run out of free opponents.
+
+A `PipelineStats` records when each battle finished and how long it took, for throughput and
+latency figures.
+"""
+import asyncio
+import collections
+import random
+import time
+
+import numpy as np
+from tqdm.auto import tqdm
+
+from .evaluation import EvaluationBackend
+from .ratings import RatingTable
+
+PipelineInfo = collections.namedtuple(
+    'PipelineInfo', ['battles', 'seconds', 'battles_per_second', 'mean_latency', 'p95_latency', 'max_in_flight'])
+
+
+class PipelineStats(object):
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.latencies = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def started(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return time.perf_counter()
+
+    def finished(self, started):
+        self.in_flight -= 1
+        self.latencies.append(time.perf_counter() - started)
+
+    def info(self):
+        seconds = time.perf_counter() - self.start
+        latencies = np.array(self.latencies or [0.0])
+        return PipelineInfo(
+            len(self.latencies),
+            seconds,
+            len(self.latencies) / seconds if seconds else 0.0,
+            float(latencies.mean()),
+            float(np.percentile(latencies, 95)),
+            self.max_in_flight,
+        )
+
+
+async def evaluate_streaming(population, num_games, backend, max_concurrent=None, verbose=True):
+    """Rates a population like `evaluate_population`, without round barriers; `max_concurrent`
+    defaults to the backend's `concurrency`, or one battle per two scripts. Returns a `PipelineInfo`."""
+    table = RatingTable(len(population))
+    slots = {id(script): slot for slot, script in enumerate(population)}
+    table.assign(population)
+    if max_concurrent is None:
+        max_concurrent = max(1, backend.concurrency or len(population) // 2)
+    semaphore = asyncio.BoundedSemaphore(max_concurrent)
+    stats = PipelineStats()
+
+    remaining = {id(script): num_games for script in population}
+    free = list(population)
+    battles = set()
+    progress = tqdm(total=num_games * len(population) // 2, disable=not verbose)
+
+    async def _battle(left, right):
+        async with semaphore:
+            started = stats.started()
+            try:
+                results = await backend.play_one(left, right)
+            finally:
+                stats.finished(started)
+        table.rate_results(results, slots, sequential=True)
+        left.rating, right.rating = table.rating(slots[id(left)]), table.rating(slots[id(right)])
+        progress.update()
+        return left, right
+
+    while True:
+        random.shuffle(free)
+        while len(free) >= 2:
+            left, right = free.pop(), free.pop()
+            remaining[id(left)] -= 1
+            remaining[id(right)] -= 1
+            battles.add(asyncio.ensure_future(_battle(left, right)))
+        if not battles:
+            break
+        done, battles = await asyncio.wait(battles, return_when=asyncio.FIRST_COMPLETED)
+        for battle in done:
+            for script in battle.result():
+                if remaining[id(script)] > 0:
+                    free.append(script)
+
+    progress.close()
+    info = stats.info()
+    if verbose:
+        print(f"{info.battles} battles in {info.seconds:.1f}s ({info.battles_per_second:.1f}/s), "
+              f"latency mean {info.mean_latency:.3f}s, p95 {info.p95_latency:.3f}s")
+    return info
+
+
+class _LatencyBackend(EvaluationBackend):
+    """Plays games between objects with a hidden `skill`, each taking a random, long-tailed time"""
+
+    def __init__(self, rng, max_players, latency):
+        self.rng = rng
+        self.max_players = max_players
+        self.concurrency = max_players // 2
+        self.latency = latency
+
+    async def play_one(self, left, right):
+        await asyncio.sleep(self.rng.lognormvariate(0, 0.75) * self.latency)
+        won = self.rng.random() < 1 / (1 + np.exp(right.skill - left.skill))
+        return [(left, right, won), (right, left, not won)]
+
+    async def play(self, pairs):
+        results = await asyncio.gather(*(self.play_one(left, right) for left, right in pairs))
+        return [result for pair_results in results for result in pair_results]
+
+
+def benchmark(population_size=256, num_games=5, max_players=64, latency=0.02, seed=0):
+    """Wall time of rounds against streaming, for battles with long-tailed durations"""
+    import types
+
+    from .evaluation import evaluate_population
+
+    rng = random.Random(seed)
+    random.seed(seed)
+    population = [types.SimpleNamespace(skill=rng.gauss(0, 1)) for _ in range(population_size)]
+    backend = _LatencyBackend(rng, max_players, latency)
+
+    start = time.perf_counter()
+    asyncio.run(evaluate_population(population, num_games, backend, verbose=False))
+    rounds = time.perf_counter() - start
+    print(f"rounds:    {num_games * (population_size // 2)} battles in {rounds:.2f}s")
+
+    info = asyncio.run(evaluate_streaming(population, num_games, backend, verbose=False))
+    print(f"streaming: {info.battles} battles in {info.seconds:.2f}s, {info.battles_per_second:.0f} battles/s, "
+          f"latency mean {1e3 * info.mean_latency:.1f} ms, p95 {1e3 * info.p95_latency:.1f} ms, "
+          f"{info.max_in_flight} in flight at most")
+
+
+if __name__ == '__main__':
+    benchmark()